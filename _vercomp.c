@@ -0,0 +1,151 @@
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include "vercomp.h"
+
+/*
+ * Python module with the version comparison of mod_vercomp, and the edit
+ * distance for package name suggestions, used by utils when available.
+ */
+
+static int get_version(PyObject *obj, const char **buf, Py_ssize_t *len) {
+    if (PyUnicode_Check(obj)) {
+        *buf = PyUnicode_AsUTF8AndSize(obj, len);
+        return *buf ? 0 : -1;
+    } else if (PyBytes_Check(obj)) {
+        *buf = PyBytes_AS_STRING(obj);
+        *len = PyBytes_GET_SIZE(obj);
+        return 0;
+    }
+    PyErr_Format(PyExc_TypeError,
+                 "version must be str or bytes, not %.200s",
+                 Py_TYPE(obj)->tp_name);
+    return -1;
+}
+
+static PyObject *vercomp_version_compare(PyObject *self, PyObject *args) {
+    PyObject *a, *b;
+    const char *bufa, *bufb;
+    Py_ssize_t lena, lenb;
+    int comp;
+    (void)self;
+    if (!PyArg_ParseTuple(args, "OO:version_compare", &a, &b))
+        return NULL;
+    if (get_version(a, &bufa, &lena) || get_version(b, &bufb, &lenb))
+        return NULL;
+    if (lena > INT_MAX || lenb > INT_MAX) {
+        PyErr_SetString(PyExc_OverflowError, "version too long");
+        return NULL;
+    }
+    comp = vercomp_compare(bufa, (int)lena, bufb, (int)lenb);
+    return PyLong_FromLong((comp > 0) - (comp < 0));
+}
+
+static PyObject *vercomp_sortkey(PyObject *self, PyObject *arg) {
+    const char *buf;
+    Py_ssize_t len;
+    PyObject *key;
+    unsigned char *out;
+    size_t keylen;
+    (void)self;
+    if (get_version(arg, &buf, &len))
+        return NULL;
+    if (len > INT_MAX) {
+        PyErr_SetString(PyExc_OverflowError, "version too long");
+        return NULL;
+    }
+    out = PyMem_Malloc(DPKG_SORTKEY_SIZE(len));
+    if (!out)
+        return PyErr_NoMemory();
+    keylen = dpkg_sortkey_write(out, (const unsigned char *)buf, (int)len);
+    key = PyBytes_FromStringAndSize((const char *)out, keylen);
+    PyMem_Free(out);
+    return key;
+}
+
+/* Levenshtein distance of two strings of Py_UCS4 code points */
+static Py_ssize_t levenshtein(const Py_UCS4 *a, Py_ssize_t lena,
+                              const Py_UCS4 *b, Py_ssize_t lenb,
+                              Py_ssize_t *row) {
+    Py_ssize_t i, j, diag, up, best;
+    for (j = 0; j <= lenb; j++)
+        row[j] = j;
+    for (i = 1; i <= lena; i++) {
+        diag = row[0];
+        row[0] = i;
+        for (j = 1; j <= lenb; j++) {
+            up = row[j];
+            best = diag + (a[i-1] != b[j-1]);
+            if (up + 1 < best)
+                best = up + 1;
+            if (row[j-1] + 1 < best)
+                best = row[j-1] + 1;
+            row[j] = best;
+            diag = up;
+        }
+    }
+    return row[lenb];
+}
+
+static PyObject *vercomp_edit_distance(PyObject *self, PyObject *args) {
+    PyObject *a, *b;
+    Py_UCS4 stack[256], *bufa, *bufb;
+    Py_ssize_t lena, lenb, rowstack[129], *row, dist;
+    (void)self;
+    if (!PyArg_ParseTuple(args, "UU:edit_distance", &a, &b))
+        return NULL;
+    lena = PyUnicode_GET_LENGTH(a);
+    lenb = PyUnicode_GET_LENGTH(b);
+    if (lena < lenb) {
+        PyObject *t = a;
+        Py_ssize_t tlen = lena;
+        a = b; lena = lenb;
+        b = t; lenb = tlen;
+    }
+    /* the row has the length of the shorter string */
+    if (lena <= 128) {
+        bufa = stack;
+        bufb = stack + 128;
+        row = rowstack;
+    } else {
+        /* the row first, so that both arrays are aligned */
+        row = PyMem_Malloc((lenb + 1) * sizeof(Py_ssize_t) +
+                           (lena + lenb) * sizeof(Py_UCS4));
+        if (!row)
+            return PyErr_NoMemory();
+        bufa = (Py_UCS4 *)(row + lenb + 1);
+        bufb = bufa + lena;
+    }
+    if (!PyUnicode_AsUCS4(a, bufa, lena, 0) ||
+            !PyUnicode_AsUCS4(b, bufb, lenb, 0)) {
+        if (row != rowstack)
+            PyMem_Free(row);
+        return NULL;
+    }
+    dist = levenshtein(bufa, lena, bufb, lenb, row);
+    if (row != rowstack)
+        PyMem_Free(row);
+    return PyLong_FromSsize_t(dist);
+}
+
+static PyMethodDef vercomp_methods[] = {
+    {"version_compare", vercomp_version_compare, METH_VARARGS,
+     "version_compare(a, b) -> -1, 0 or 1\n\n"
+     "Compare two Debian versions like the vercomp collation."},
+    {"sortkey", vercomp_sortkey, METH_O,
+     "sortkey(version) -> bytes\n\n"
+     "Sort key of a Debian version, same as dpkg_sortkey() in SQL."},
+    {"edit_distance", vercomp_edit_distance, METH_VARARGS,
+     "edit_distance(a, b) -> int\n\n"
+     "Levenshtein distance of two strings."},
+    {NULL, NULL, 0, NULL}
+};
+
+static struct PyModuleDef vercomp_module = {
+    PyModuleDef_HEAD_INIT, "_vercomp",
+    "Debian version comparison from mod_vercomp.", -1, vercomp_methods,
+    NULL, NULL, NULL, NULL
+};
+
+PyMODINIT_FUNC PyInit__vercomp(void) {
+    return PyModule_Create(&vercomp_module);
+}
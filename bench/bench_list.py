@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Benchmarks the /list.json body:
+
+  dumps    the former way: a dict for every package in a list, then one
+           json.dumps() of the whole list
+  stream   main.stream_pkg_list(): chunks written from the cursor
+
+Usage (from the source directory, after `make`):
+
+  bench/bench_list.py [--rounds 5]
+
+Each way runs in a fresh process, which reports the growth of its peak
+RSS while making the body, the time to the first chunk and the total
+time. Also checks that both ways give the same output.
+'''
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import resource
+import subprocess
+
+SRCDIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SRCDIR)
+
+
+def body_dumps(main, modified):
+    with main.plugin.connection() as db:
+        packages = []
+        for row in db.execute(main.SQL_GET_PACKAGE_LIST):
+            d = dict(row)
+            packages.append(d)
+        yield json.dumps({'packages': packages, 'last_modified': modified},
+                         sort_keys=True).encode('utf-8')
+
+
+def body_stream(main, modified):
+    return main.stream_pkg_list(modified)
+
+
+METHODS = {'dumps': body_dumps, 'stream': body_stream}
+
+
+def child(method):
+    import main
+    with main.plugin.connection() as db:
+        modified = main.db_last_modified(db)
+        # warm up the page cache and the connection pool
+        db.execute(main.SQL_GET_PACKAGE_LIST).fetchall()
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    md5 = hashlib.md5()
+    size = 0
+    first = None
+    start = time.perf_counter()
+    for chunk in METHODS[method](main, modified):
+        if first is None:
+            first = time.perf_counter() - start
+        md5.update(chunk)
+        size += len(chunk)
+    total = time.perf_counter() - start
+    print(json.dumps({
+        'rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss,
+        'first': first, 'total': total, 'size': size,
+        'md5': md5.hexdigest(),
+    }))
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--child', choices=METHODS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child)
+        return 0
+
+    results = {}
+    for method in METHODS:
+        runs = []
+        for i in range(args.rounds):
+            proc = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--child', method],
+                stdout=subprocess.PIPE, universal_newlines=True, check=True)
+            runs.append(json.loads(proc.stdout))
+        results[method] = {
+            key: min(run[key] for run in runs)
+            for key in ('rss', 'first', 'total')}
+        results[method]['size'] = runs[0]['size']
+        results[method]['md5'] = {run['md5'] for run in runs}
+
+    print('%d bytes, best of %d' % (results['dumps']['size'], args.rounds))
+    print('%-8s %12s %14s %11s' % ('method', 'peak RSS +', 'first chunk', 'total'))
+    for method, r in results.items():
+        print('%-8s %9d KiB %11.2f ms %8.2f ms' % (
+            method, r['rss'], r['first'] * 1e3, r['total'] * 1e3))
+    if len(set.union(*(r['md5'] for r in results.values()))) != 1:
+        print('outputs differ!')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_())
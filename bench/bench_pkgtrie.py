@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Compares the package name autocompleter formats of /pkgtrie.js:
+
+  object   the former nested JavaScript object trie, one object per character
+  dafsa    the packed minimized automaton from dafsa.py
+
+Usage (from the source directory):
+
+  bench/bench_pkgtrie.py [--db data/abbs.db | -n 10000 | --names FILE]
+
+Prints the payload sizes (plain, gzip and, if available, Brotli) and the
+time to build them. If node is installed, it also prints how long a
+browser engine takes to load each format and unpack it, and checks that
+the completions of static/autocomplete.js match dafsa.complete().
+'''
+
+import os
+import re
+import sys
+import json
+import gzip
+import time
+import random
+import sqlite3
+import argparse
+import subprocess
+import shutil
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+SRCDIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SRCDIR)
+
+import dafsa
+
+# the former encoder from main.py
+RE_QUOTES = re.compile(r'"([a-z]+|\$)"')
+
+PREFIXES = ('', '', '', 'lib', 'python-', 'perl-', 'ruby-', 'rust-', 'font-',
+            'kf5-', 'qt-', 'gst-plugins-', 'x11-', 'golang-', 'node-')
+STEMS = ('gtk', 'glib', 'bash', 'core', 'util', 'xml', 'ssl', 'net', 'audio',
+         'video', 'image', 'crypt', 'zip', 'kde', 'gnome', 'http', 'json')
+SUFFIXES = ('', '', '', '-dev', '-doc', '-utils', '2', '3', '-bin', '-tools',
+            '-extra', '-common', '-data')
+
+JS_BENCH = r'''
+var fs = require('fs'), vm = require('vm');
+var args = JSON.parse(fs.readFileSync(0, 'utf8'));
+var document = {addEventListener: function(){}};
+eval(fs.readFileSync(args.autocomplete, 'utf8'));
+function load(src, i) {
+  // a unique source each time, so nothing is reused from earlier rounds
+  var ctx = {};
+  var start = process.hrtime.bigint();
+  vm.runInNewContext(src + '\n//' + i, ctx);
+  var trie = ctx.pkgTrie;
+  if (typeof trie === 'string') trie = unpackTrie(trie);
+  return [Number(process.hrtime.bigint() - start) / 1e6, trie];
+}
+var result = {};
+for (var name in args.sources) {
+  var times = [], trie;
+  for (var i = 0; i < args.rounds; i++) {
+    var r = load(args.sources[name], i);
+    times.push(r[0]);
+    trie = r[1];
+  }
+  times.sort(function(a, b) { return a - b; });
+  result[name] = {load: times[times.length >> 1]};
+  if (name === 'dafsa') {
+    var start = process.hrtime.bigint();
+    result[name].completions = args.terms.map(function(t) {
+      return prefixSearch(trie, t);
+    });
+    result[name].search = Number(process.hrtime.bigint() - start) / 1e6;
+  }
+}
+console.log(JSON.stringify(result));
+'''
+
+
+def gen_trie(wordlist):
+    trie = {}
+    for word in wordlist:
+        p = trie
+        for c in word:
+            if c not in p:
+                p[c] = {}
+            p = p[c]
+        p['$'] = 0
+    return trie
+
+
+def object_js(names):
+    return 'var pkgTrie = %s;\n' % RE_QUOTES.sub('\\1', json.dumps(
+        gen_trie(names), separators=',:')).replace('{$:0}', '0')
+
+
+def dafsa_js(names):
+    return 'var pkgTrie = %s;\n' % json.dumps(dafsa.pack(names))
+
+
+def load_names(args):
+    if args.names:
+        with open(args.names, 'r', encoding='utf-8') as f:
+            return sorted({ln.strip() for ln in f if ln.strip()})
+    if args.db:
+        db = sqlite3.connect('file:%s?mode=ro' % args.db, uri=True)
+        names = [row[0] for row in db.execute('SELECT name FROM packages')]
+        db.close()
+        return names
+    rnd = random.Random(args.seed)
+    names = set()
+    while len(names) < args.n:
+        name = rnd.choice(PREFIXES) + rnd.choice(STEMS)
+        if rnd.random() < 0.3:
+            name += rnd.choice(STEMS)
+        names.add(name + rnd.choice(SUFFIXES))
+    return sorted(names)
+
+
+def sizes(data):
+    data = data.encode('utf-8')
+    result = [len(data), len(gzip.compress(data, 9))]
+    if brotli is not None:
+        result.append(len(brotli.compress(data, brotli.MODE_TEXT)))
+    return result
+
+
+def node_bench(node, sources, terms, rounds):
+    args = {
+        'autocomplete': os.path.join(SRCDIR, 'static', 'autocomplete.js'),
+        'sources': sources, 'terms': terms, 'rounds': rounds,
+    }
+    proc = subprocess.run([node, '-e', JS_BENCH], input=json.dumps(args),
+                          stdout=subprocess.PIPE, universal_newlines=True,
+                          check=True)
+    return json.loads(proc.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--db', help='abbs.db to take package names from')
+    parser.add_argument('--names', help='file with one package name per line')
+    parser.add_argument('-n', type=int, default=10000,
+                        help='number of synthetic names (without --db)')
+    parser.add_argument('--rounds', type=int, default=20,
+                        help='number of loads in node')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    names = load_names(args)
+    print('%d names' % len(names))
+    builders = {'object': object_js, 'dafsa': dafsa_js}
+    sources = {}
+    print('\n  %-8s %9s %9s %9s %9s' % (
+        'format', 'build ms', 'bytes', 'gzip', 'br' if brotli else ''))
+    for name, func in builders.items():
+        start = time.perf_counter()
+        sources[name] = func(names)
+        elapsed = time.perf_counter() - start
+        print('  %-8s %9.1f %s' % (name, elapsed * 1e3, ' '.join(
+            '%9d' % x for x in sizes(sources[name]))))
+
+    node = shutil.which('node') or shutil.which('nodejs')
+    if not node:
+        print('\nnode not found, skipping load times')
+        return 0
+    rnd = random.Random(args.seed)
+    terms = [name[:rnd.randint(2, len(name) + 1)] for name in
+             rnd.sample(names, min(len(names), 1000))]
+    result = node_bench(node, sources, terms, args.rounds)
+    print('\nload in node (median of %d)' % args.rounds)
+    for name in builders:
+        print('  %-8s %9.2f ms' % (name, result[name]['load']))
+    print('  %d dafsa searches: %.2f ms' % (
+        len(terms), result['dafsa']['search']))
+    root = dafsa.unpack(dafsa.pack(names))
+    bad = [t for t, got in zip(terms, result['dafsa']['completions'])
+           if got != dafsa.complete(root, t.lower())]
+    if bad:
+        print('  completions differ from dafsa.complete() for %r' % bad[:10])
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Benchmarks /search/ result pages for common queries:
+
+  fetchall   the former way: fetch, escape and highlight every result,
+             then page in Python
+  paged      main.db_search() without its cache: LIMIT/OFFSET in SQL,
+             only the page is highlighted
+  cached     main.db_search() again, from its cache
+
+Usage (from the source directory, after `make`):
+
+  bench/bench_search.py [--db data/abbs.db] [--rounds 5] [query ...]
+
+Also checks that both ways give the same pages.
+'''
+
+import os
+import sys
+import html
+import time
+import sqlite3
+import argparse
+
+SRCDIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SRCDIR)
+
+import utils
+import main
+
+QUERIES = ('lib', 'python', 'gtk lib', 'font', 'qt', 'x11', 'glibc', 'kde-',
+           'rust', 'perl-', 'ssl', 'a', 'nonexistent')
+
+# the former query, without LIMIT/OFFSET
+SQL_SEARCH_FETCHALL = '''
+SELECT q.name, q.description, q.desc_highlight, vp.full_version
+FROM (
+  SELECT
+    vp.name, vp.description,
+    highlight(fts_packages, 1, '<b>', '</b>') desc_highlight,
+    (CASE WHEN vp.name=? THEN 1
+     WHEN instr(vp.name, ?)=0 THEN 3 ELSE 2 END) matchcls,
+    bm25(fts_packages, 5, 1) ftrank
+  FROM packages vp
+  INNER JOIN fts_packages fp ON fp.name=vp.name
+  WHERE fts_packages MATCH ?
+  UNION ALL
+  SELECT
+    vp.name, vp.description, vp.description desc_highlight,
+    2 matchcls, 1.0 ftrank
+  FROM v_packages vp
+  LEFT JOIN fts_packages fp ON fp.name=vp.name AND fts_packages MATCH ?
+  WHERE vp.name LIKE ('%' || ? || '%') AND vp.name!=? AND fp.name IS NULL
+) q
+INNER JOIN v_packages vp ON vp.name=q.name
+ORDER BY q.matchcls, q.ftrank, vp.commit_time DESC, q.name
+'''
+
+
+def search_fetchall(db, q, pagesize, page):
+    packages = []
+    qesc = main.RE_FTS5_COLSPEC.sub(r'"\1"', q)
+    try:
+        rows = db.execute(SQL_SEARCH_FETCHALL, (qesc,)*6).fetchall()
+    except sqlite3.OperationalError:
+        rows = []
+    for row in rows:
+        d = dict(row)
+        d['desc_highlight'] = html.escape(d['desc_highlight']).replace(
+            '&lt;b&gt;', '<b>').replace('&lt;/b&gt;', '</b>')
+        d['name_highlight'] = html.escape(d['name']).replace(q, '<b>%s</b>' % q)
+        packages.append(d)
+    res = utils.Pager(packages, pagesize, page)
+    result = list(res)
+    res.pagecount()
+    return result, res.count()
+
+
+def connect(filename):
+    db = sqlite3.connect('file:%s?mode=ro' % filename, uri=True)
+    db.row_factory = sqlite3.Row
+    db.enable_load_extension(True)
+    db.load_extension('./mod_vercomp')
+    db.enable_load_extension(False)
+    return db
+
+
+def timeit(func, rounds):
+    best = None
+    for i in range(rounds):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--db', default='data/abbs.db')
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('queries', nargs='*', default=QUERIES)
+    args = parser.parse_args()
+
+    db = connect(args.db)
+    ok = True
+    print('%-14s %5s %6s %11s %11s %11s' % (
+        'query', 'page', 'count', 'fetchall', 'paged', 'cached'))
+    for q in args.queries:
+        for page in (1, 3):
+            old_time, old = timeit(lambda: search_fetchall(
+                db, q, main.PAGESIZE, page), args.rounds)
+
+            def paged():
+                main.db_search.cache.clear()
+                return main.db_search(db, q, main.PAGESIZE, page)
+            new_time, new = timeit(paged, args.rounds)
+            cached_time, _ = timeit(lambda: main.db_search(
+                db, q, main.PAGESIZE, page), args.rounds)
+            print('%-14s %5d %6d %8.2f ms %8.2f ms %8.3f ms' % (
+                q, page, old[1], old_time * 1e3, new_time * 1e3,
+                cached_time * 1e3))
+            if old != new:
+                print('  results differ!')
+                ok = False
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main_())
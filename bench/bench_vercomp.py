@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Benchmarks and cross-checks the implementations of Debian version ordering:
+
+  sqlite     the vercomp collation and dpkg_sortkey() in mod_vercomp
+  _vercomp   the same C code as a Python module, if built
+  python     utils' pure-Python fallbacks (debian_support and the sort key)
+
+Usage (from the source directory, after `make`):
+
+  bench/bench_vercomp.py [--db data/abbs.db | -n 20000] [--fuzz 100000]
+
+Versions come from dpkg_packages and package_versions, or from a synthetic
+generator. With --fuzz, random and mutated versions, including invalid
+ones, are compared by every implementation; any disagreement is printed
+and the exit status is 1.
+'''
+
+import os
+import sys
+import time
+import random
+import sqlite3
+import argparse
+import functools
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import utils
+import debian_support
+
+SQL_VERSIONS = '''
+SELECT version FROM dpkg_packages
+UNION
+SELECT dpkg_version(version, release, epoch) FROM package_versions
+WHERE version IS NOT NULL
+'''
+
+MUTATION_CHARS = '0123456789.+-:~abzAZ_ é'
+
+
+def sign(x):
+    return (x > 0) - (x < 0)
+
+
+def connect(filename=':memory:'):
+    db = sqlite3.connect(filename)
+    db.enable_load_extension(True)
+    db.load_extension('./mod_vercomp')
+    db.enable_load_extension(False)
+    return db
+
+
+def synthetic_version(rnd):
+    parts = []
+    for i in range(rnd.randint(1, 4)):
+        parts.append(str(rnd.choice((0, 1, 2, 3, 9, 10, 12, 99, 2023, 20230101))))
+    version = '.'.join(parts)
+    version += rnd.choice(('', '', '', 'a', 'b2', '~rc1', '~beta2', '+git20230101',
+                           '+dfsg', 'p1', '~~', '+b1'))
+    if rnd.random() < 0.1:
+        version = '%d:%s' % (rnd.randint(0, 3), version)
+    if rnd.random() < 0.6:
+        version += '-%d' % rnd.randint(0, 5)
+        if rnd.random() < 0.2:
+            version += rnd.choice(('.1', '~bpo1', 'ubuntu1', '+b2'))
+    return version
+
+
+def mutate(rnd, version):
+    chars = list(version)
+    for i in range(rnd.randint(1, 3)):
+        op = rnd.randrange(3)
+        pos = rnd.randint(0, len(chars))
+        if op == 0 or not chars:
+            chars.insert(pos, rnd.choice(MUTATION_CHARS))
+        elif op == 1:
+            del chars[min(pos, len(chars) - 1)]
+        else:
+            chars[min(pos, len(chars) - 1)] = rnd.choice(MUTATION_CHARS)
+    return ''.join(chars)
+
+
+def load_versions(args):
+    if args.db:
+        db = connect('file:%s?mode=ro' % args.db)
+        versions = [row[0] for row in db.execute(SQL_VERSIONS)]
+        db.close()
+        return versions
+    rnd = random.Random(args.seed)
+    return list({synthetic_version(rnd) for i in range(args.n)})
+
+
+def dpkg_valid(version):
+    '''
+    debian_support also accepts an empty revision ("1.0-") or upstream
+    version ("-1") as part of the upstream version, which dpkg rejects.
+    '''
+    try:
+        ver = debian_support.Version(version)
+    except ValueError:
+        return False
+    return ver.debian_revision is not None or '-' not in ver.upstream_version
+
+
+def debian_compare(a, b):
+    ''' debian_support, or None if either version is invalid. '''
+    if dpkg_valid(a) and dpkg_valid(b):
+        return debian_support.version_compare(a, b)
+    return None
+
+
+def implementations(db):
+    impls = {
+        'sqlite collation': lambda a, b: db.execute(
+            'SELECT (?1 > ?2 COLLATE vercomp) - (?1 < ?2 COLLATE vercomp)',
+            (a, b)).fetchone()[0],
+        'sqlite dpkg_sortkey': lambda a, b: db.execute(
+            'SELECT (dpkg_sortkey(?1) > dpkg_sortkey(?2)) - '
+            '(dpkg_sortkey(?1) < dpkg_sortkey(?2))', (a, b)).fetchone()[0],
+        'python sortkey': lambda a, b: utils.cmp(
+            utils._py_dpkg_sortkey(a), utils._py_dpkg_sortkey(b)),
+        'python version_compare': utils._py_version_compare.__wrapped__,
+    }
+    if utils._vercomp:
+        impls['_vercomp version_compare'] = utils._vercomp.version_compare
+        impls['_vercomp sortkey'] = lambda a, b: utils.cmp(
+            utils._vercomp.sortkey(a), utils._vercomp.sortkey(b))
+    return impls
+
+
+def timeit(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def benchmark(db, versions, rounds):
+    rnd = random.Random(1)
+    pairs = [(rnd.choice(versions), rnd.choice(versions))
+             for i in range(rounds)]
+    print('%d versions, %d compares' % (len(versions), len(pairs)))
+
+    compares = {
+        'debian_support (uncached)': utils._py_version_compare.__wrapped__,
+    }
+    if utils._vercomp:
+        compares['_vercomp.version_compare'] = utils._vercomp.version_compare
+    print('\nsingle compares')
+    for name, func in compares.items():
+        elapsed, _ = timeit(lambda: [func(a, b) for a, b in pairs])
+        print('  %-34s %8.2f us/op' % (name, elapsed / len(pairs) * 1e6))
+
+    sorts = {
+        'cmp_to_key(debian_support)': lambda: sorted(
+            versions, key=functools.cmp_to_key(
+                utils._py_version_compare.__wrapped__)),
+        'key=utils._py_dpkg_sortkey': lambda: sorted(
+            versions, key=utils._py_dpkg_sortkey),
+    }
+    if utils._vercomp:
+        sorts['cmp_to_key(_vercomp)'] = lambda: sorted(
+            versions, key=functools.cmp_to_key(utils._vercomp.version_compare))
+        sorts['key=_vercomp.sortkey'] = lambda: sorted(
+            versions, key=utils._vercomp.sortkey)
+    print('\nsorting all versions')
+    for name, func in sorts.items():
+        elapsed, _ = timeit(func)
+        print('  %-34s %8.1f ms' % (name, elapsed * 1e3))
+
+    db.execute('CREATE TEMP TABLE versions (version TEXT, version_key BLOB)')
+    db.executemany('INSERT INTO versions VALUES (?, dpkg_sortkey(?1))',
+                   ((v,) for v in versions))
+    db.execute('CREATE INDEX idx_versions_key ON versions (version_key)')
+    queries = {
+        'ORDER BY version COLLATE vercomp':
+            'SELECT version FROM versions ORDER BY version COLLATE vercomp',
+        'ORDER BY dpkg_sortkey(version)':
+            'SELECT version FROM versions ORDER BY dpkg_sortkey(version)',
+        'ORDER BY version_key (indexed)':
+            'SELECT version FROM versions ORDER BY version_key',
+        'max(version COLLATE vercomp)':
+            'SELECT max(version COLLATE vercomp) FROM versions',
+        'max_vercomp(version)':
+            'SELECT max_vercomp(version) FROM versions',
+        'max(version_key) (indexed)':
+            'SELECT version, max(version_key) FROM versions',
+    }
+    print('\nSQL')
+    results = set()
+    for name, sql in queries.items():
+        elapsed, rows = timeit(lambda: db.execute(sql).fetchall())
+        if name.startswith('ORDER'):
+            results.add(tuple(row[0] for row in rows))
+        print('  %-34s %8.1f ms' % (name, elapsed * 1e3))
+    db.execute('DROP TABLE versions')
+    if len(results) != 1:
+        print('  ORDER BY results differ!')
+        return False
+    return True
+
+
+def fuzz(db, versions, count, seed):
+    rnd = random.Random(seed)
+    impls = implementations(db)
+    reference = 'sqlite collation'
+    failures = 0
+    for i in range(count):
+        a, b = rnd.choice(versions), rnd.choice(versions)
+        if rnd.random() < 0.5:
+            a = mutate(rnd, a)
+        if rnd.random() < 0.3:
+            b = mutate(rnd, a if rnd.random() < 0.5 else b)
+        results = {name: sign(func(a, b)) for name, func in impls.items()}
+        expected = results[reference]
+        deb = debian_compare(a, b)
+        if deb is not None:
+            # dpkg-equal versions are ordered bytewise everywhere
+            results['debian_support'] = deb or utils.cmp(a, b)
+        else:
+            # invalid versions: utils' fallback may compare plain strings
+            del results['python version_compare']
+        bad = {name: r for name, r in results.items() if r != expected}
+        if bad:
+            failures += 1
+            if failures <= 20:
+                print('  %r <=> %r: %s %d, %s' % (
+                    a, b, reference, expected,
+                    ', '.join('%s %d' % x for x in bad.items())))
+    print('\nfuzz: %d pairs, %d disagreements' % (count, failures))
+    return not failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--db', help='abbs.db to take versions from')
+    parser.add_argument('-n', type=int, default=20000,
+                        help='number of synthetic versions (without --db)')
+    parser.add_argument('--rounds', type=int, default=100000,
+                        help='number of single compares')
+    parser.add_argument('--fuzz', type=int, default=0,
+                        help='number of pairs to fuzz')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    db = connect()
+    versions = load_versions(args)
+    ok = benchmark(db, versions, args.rounds)
+    if args.fuzz:
+        ok = fuzz(db, versions, args.fuzz, args.seed) and ok
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
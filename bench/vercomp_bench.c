@@ -0,0 +1,262 @@
+/*
+ * Microbenchmark for the vercomp collation.
+ *
+ * Sorts a corpus of version strings with the collation from vercomp.c and
+ * with the previous malloc-based implementation kept below for reference,
+ * then checks that both agree on every adjacent pair.
+ *
+ * Usage:
+ *   sqlite3 data/abbs.db 'SELECT version FROM dpkg_packages' \
+ *     | bench/vercomp_bench
+ *   bench/vercomp_bench -n 200000    # synthetic corpus
+ */
+#define _POSIX_C_SOURCE 200809L
+#include <ctype.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <time.h>
+#include "../vercomp.c"
+
+typedef int (*collation_fn)(void *, int, const void *, int, const void *);
+
+/* Reference: the implementation before it was made allocation-free. */
+
+typedef struct ref_version {
+    long epoch;
+    const char* version;
+    const char* revision;
+} ref_version_t;
+
+static ref_version_t ref_parse_version(char *string) {
+    ref_version_t version = {0, "", "0"};
+    char *colon, *hyphen;
+    colon = strchr(string, ':');
+    if (colon) {
+        version.epoch = strtol(string, NULL, 10);
+        string = colon+1;
+    }
+    version.version = string;
+    hyphen = strrchr(string, '-');
+    if (hyphen) {
+        *hyphen++ = 0;
+        version.revision = hyphen;
+    }
+    return version;
+}
+
+static int ref_order(int c) {
+    if (isdigit(c)) {
+        return 0;
+    } else if (isalpha(c)) {
+        return c;
+    } else if (c == '~') {
+        return -1;
+    } else if (c) {
+        return c + 256;
+    } else {
+        return 0;
+    }
+}
+
+static int ref_version_compare(const char *a, const char *b) {
+    while (*a || *b) {
+        int first_diff = 0;
+
+        while ((*a && !isdigit(*a)) || (*b && !isdigit(*b))) {
+            int ac = ref_order(*a);
+            int bc = ref_order(*b);
+
+            if (ac != bc)
+                return ac - bc;
+
+            a++;
+            b++;
+        }
+        while (*a == '0')
+            a++;
+        while (*b == '0')
+            b++;
+        while (isdigit(*a) && isdigit(*b)) {
+            if (!first_diff)
+                first_diff = *a - *b;
+            a++;
+            b++;
+        }
+
+        if (isdigit(*a))
+            return 1;
+        if (isdigit(*b))
+            return -1;
+        if (first_diff)
+            return first_diff;
+    }
+    return 0;
+}
+
+static int ref_dpkg_version_compare(char *svera, char *sverb){
+    ref_version_t vera, verb;
+    int comp;
+    vera = ref_parse_version(svera);
+    verb = ref_parse_version(sverb);
+
+    if (vera.epoch < verb.epoch) {
+        return -1;
+    } else if (vera.epoch > verb.epoch) {
+        return 1;
+    }
+    comp = ref_version_compare(vera.version, verb.version);
+    if (comp) return comp;
+    return ref_version_compare(vera.revision, verb.revision);
+}
+
+static int ref_collation(
+    void *pArg, int nSa, const void *bSa, int nSb, const void *bSb
+){
+    char *svera, *sverb;
+    int comp;
+    UNUSED(pArg);
+    svera = (char *)malloc(nSa + 1);
+    sverb = (char *)malloc(nSb + 1);
+    svera[nSa] = sverb[nSb] = 0;
+    memcpy(svera, bSa, nSa);
+    memcpy(sverb, bSb, nSb);
+    comp = ref_dpkg_version_compare(svera, sverb);
+    if (comp == 0) {
+        memcpy(svera, bSa, nSa);
+        memcpy(sverb, bSb, nSb);
+        comp = strcmp(svera, sverb);
+    }
+    free(svera);
+    free(sverb);
+    return comp;
+}
+
+/* Corpus */
+
+typedef struct item {
+    const char *s;
+    int n;
+} item_t;
+
+static collation_fn current;
+
+static int item_cmp(const void *x, const void *y) {
+    const item_t *a = x, *b = y;
+    return current(NULL, a->n, a->s, b->n, b->s);
+}
+
+static int sign(int x) {
+    return (x > 0) - (x < 0);
+}
+
+static char *synthetic(unsigned *seed) {
+    static const char *tails[] = {
+        "", "~rc1", "~beta2", "+git20230101", "a", "p1", ".0", "+dfsg"};
+    char buf[96];
+    int len = 0;
+    int parts = 1 + rand_r(seed) % 4;
+    if (rand_r(seed) % 8 == 0)
+        len += sprintf(buf + len, "%d:", rand_r(seed) % 3);
+    for (int i = 0; i < parts; i++)
+        len += sprintf(buf + len, i ? ".%d" : "%d", rand_r(seed) % 30);
+    len += sprintf(buf + len, "%s", tails[rand_r(seed) % 8]);
+    if (rand_r(seed) % 2)
+        len += sprintf(buf + len, "-%d", rand_r(seed) % 5);
+    return strdup(buf);
+}
+
+static double now(void) {
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return ts.tv_sec + ts.tv_nsec / 1e9;
+}
+
+static double bench_sort(collation_fn fn, const item_t *items, size_t n) {
+    item_t *copy = malloc(n * sizeof(item_t));
+    memcpy(copy, items, n * sizeof(item_t));
+    current = fn;
+    double start = now();
+    qsort(copy, n, sizeof(item_t), item_cmp);
+    double elapsed = now() - start;
+    free(copy);
+    return elapsed;
+}
+
+static double bench_pairs(collation_fn fn, const item_t *items, size_t n,
+                          size_t rounds, long *checksum) {
+    long sum = 0;
+    double start = now();
+    for (size_t r = 0; r < rounds; r++) {
+        for (size_t i = 1; i < n; i++) {
+            sum += sign(fn(NULL, items[i-1].n, items[i-1].s,
+                           items[i].n, items[i].s));
+        }
+    }
+    *checksum = sum;
+    return now() - start;
+}
+
+int main(int argc, char **argv) {
+    size_t n = 0, cap = 1024, rounds = 20;
+    item_t *items = malloc(cap * sizeof(item_t));
+    unsigned seed = 42;
+
+    if (argc == 3 && !strcmp(argv[1], "-n")) {
+        size_t count = strtoul(argv[2], NULL, 10);
+        items = realloc(items, count * sizeof(item_t));
+        for (n = 0; n < count; n++) {
+            items[n].s = synthetic(&seed);
+            items[n].n = strlen(items[n].s);
+        }
+    } else {
+        char *line = NULL;
+        size_t linecap = 0;
+        ssize_t len;
+        while ((len = getline(&line, &linecap, stdin)) > 0) {
+            if (line[len-1] == '\n')
+                line[--len] = 0;
+            if (n == cap)
+                items = realloc(items, (cap *= 2) * sizeof(item_t));
+            /* no NUL terminator: the collation must not need one */
+            char *s = malloc(len ? len : 1);
+            memcpy(s, line, len);
+            items[n].s = s;
+            items[n].n = len;
+            n++;
+        }
+        free(line);
+    }
+    if (n < 2) {
+        fprintf(stderr, "need at least two versions\n");
+        return 1;
+    }
+
+    size_t mismatches = 0;
+    for (size_t i = 1; i < n; i++) {
+        int old = ref_collation(NULL, items[i-1].n, items[i-1].s,
+                                items[i].n, items[i].s);
+        int new = vercomp_collation(NULL, items[i-1].n, items[i-1].s,
+                                    items[i].n, items[i].s);
+        if (sign(old) != sign(new)) {
+            if (mismatches++ < 10)
+                fprintf(stderr, "mismatch: %.*s <=> %.*s: %d != %d\n",
+                        items[i-1].n, items[i-1].s, items[i].n, items[i].s,
+                        sign(old), sign(new));
+        }
+    }
+
+    long sum_old, sum_new;
+    double t_old = bench_pairs(ref_collation, items, n, rounds, &sum_old);
+    double t_new = bench_pairs(vercomp_collation, items, n, rounds, &sum_new);
+    size_t ncmp = (n - 1) * rounds;
+    printf("%zu versions, %zu comparisons, %zu mismatches\n",
+           n, ncmp, mismatches);
+    printf("compare  reference %8.1f ns/op   current %8.1f ns/op   %.2fx\n",
+           t_old / ncmp * 1e9, t_new / ncmp * 1e9, t_old / t_new);
+    t_old = bench_sort(ref_collation, items, n);
+    t_new = bench_sort(vercomp_collation, items, n);
+    printf("qsort    reference %8.1f ms      current %8.1f ms      %.2fx\n",
+           t_old * 1e3, t_new * 1e3, t_old / t_new);
+    return mismatches ? 2 : (sum_old != sum_new);
+}
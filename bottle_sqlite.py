@@ -9,6 +9,15 @@ searches for route callbacks that require a `db` keyword argument
 (configurable) and skips routes that do not. This removes any overhead for
 routes that don't need a database connection.
 
+With `pool=True`, connections are not closed after each request. They are
+kept warm in a per-process pool instead, with extensions loaded, functions
+registered and databases attached only once (see `utils.Pool`). A pooled
+connection is dropped when the database file is replaced, so swapping in a
+new file is safe.
+
+Databases in `lazy_attach` are attached by `plugin.attach_lazy(db, name)` in
+the routes that need them, and stay attached to pooled connections.
+
 Usage Example::
 
     import bottle
@@ -34,7 +43,10 @@ __license__ = 'MIT'
 
 import sqlite3
 import inspect
+import threading
+import contextlib
 import bottle
+import utils
 
 # PluginError is defined to bottle >= 0.10
 if not hasattr(bottle, 'PluginError'):
@@ -43,6 +55,53 @@ if not hasattr(bottle, 'PluginError'):
     bottle.PluginError = PluginError
 
 
+def connect(dbfile, readonly=False, dictrows=True, text_factory=str,
+            functions=None, aggregates=None, collations=None,
+            extensions=None, attach=None, cached_statements=128,
+            check_same_thread=True):
+    ''' Open a connection and set it up as configured. '''
+    if readonly:
+        # drive letters not transformed
+        urifn = dbfile.replace('?', '%3f').replace('#', '%23')
+        db = sqlite3.connect('file:%s?mode=ro' % urifn, uri=True,
+                             cached_statements=cached_statements,
+                             check_same_thread=check_same_thread)
+    else:
+        db = sqlite3.connect(dbfile, cached_statements=cached_statements,
+                             check_same_thread=check_same_thread)
+    # set text factory
+    db.text_factory = text_factory
+    # This enables column access by name: row['column_name']
+    if dictrows:
+        db.row_factory = sqlite3.Row
+    # Create user functions, aggregates and collations
+    for name, value in (functions or {}).items():
+        db.create_function(name, *value)
+    for name, value in (aggregates or {}).items():
+        db.create_aggregate(name, *value)
+    for name, value in (collations or {}).items():
+        db.create_collation(name, value)
+    if extensions:
+        db.enable_load_extension(True)
+        for name in extensions:
+            db.execute("SELECT load_extension(?)", (name,))
+        db.enable_load_extension(False)
+    for name, value in (attach or {}).items():
+        db.execute("ATTACH ? AS %s" % name, (value,))
+    return db
+
+
+def reset_connection(db, attached=()):
+    ''' Makes a pooled connection clean for the next request. '''
+    if db.in_transaction:
+        db.rollback()
+    # undo ATTACHes made by the route callback
+    attached = frozenset(('main', 'temp')).union(attached)
+    for row in db.execute("PRAGMA database_list").fetchall():
+        if row[1] not in attached:
+            db.execute("DETACH %s" % row[1])
+
+
 class SQLitePlugin(object):
     ''' This plugin passes an sqlite3 database handle to route callbacks
     that accept a `db` keyword argument. If a callback does not expect
@@ -61,7 +120,8 @@ class SQLitePlugin(object):
     def __init__(self, dbfile=':memory:', autocommit=True, dictrows=True,
                  keyword='db', text_factory=unicode, readonly=False,
                  functions=None, aggregates=None, collations=None,
-                 extensions=None):
+                 extensions=None, attach=None, pool=False, pool_size=8,
+                 cached_statements=128, lazy_attach=None):
         self.dbfile = dbfile
         self.autocommit = autocommit
         self.dictrows = dictrows
@@ -72,6 +132,13 @@ class SQLitePlugin(object):
         self.aggregates = aggregates or {}
         self.collations = collations or {}
         self.extensions = extensions or ()
+        self.attach = attach or {}
+        self.pool = pool
+        self.pool_size = pool_size
+        self.cached_statements = cached_statements
+        self.lazy_attach = lazy_attach or {}
+        self.pools = {}
+        self.pools_lock = threading.Lock()
 
     def setup(self, app):
         ''' Make sure that other installed plugins don't affect the same
@@ -85,6 +152,74 @@ class SQLitePlugin(object):
             elif other.name == self.name:
                 self.name += '_%s' % self.keyword
 
+    def close(self):
+        with self.pools_lock:
+            pools, self.pools = self.pools, {}
+        for pool in pools.values():
+            pool.clear()
+
+    def settings(self, g=lambda key, default: default):
+        ''' Connection settings, optionally overridden by `g`. '''
+        return {
+            'dictrows': g('dictrows', self.dictrows),
+            'text_factory': g('text_factory', self.text_factory),
+            'readonly': g('readonly', self.readonly),
+            'functions': g('functions', self.functions),
+            'aggregates': g('aggregates', self.aggregates),
+            'collations': g('collations', self.collations),
+            'extensions': g('extensions', self.extensions),
+            'attach': g('attach', self.attach),
+            'cached_statements': g('cached_statements', self.cached_statements),
+        }
+
+    def attach_lazy(self, db, name):
+        ''' Attaches the database `name` of `lazy_attach`, unless the
+            connection has it already. '''
+        if not any(row[1] == name
+                   for row in db.execute("PRAGMA database_list")):
+            db.execute("ATTACH ? AS %s" % name, (self.lazy_attach[name],))
+
+    @contextlib.contextmanager
+    def connection(self):
+        ''' A connection with the default settings, for use outside of
+            route callbacks. It is taken from the pool if enabled. '''
+        settings = self.settings()
+        if self.pool:
+            pool = self.get_pool(self.dbfile, settings)
+            with pool.connection() as db:
+                yield db
+        else:
+            db = connect(self.dbfile, **settings)
+            try:
+                yield db
+            finally:
+                db.close()
+
+    def get_pool(self, dbfile, settings):
+        ''' Routes with the same connection settings share one pool. '''
+        key = (dbfile,) + tuple(
+            tuple(sorted(v)) if isinstance(v, dict) else
+            tuple(v) if isinstance(v, (list, tuple)) else v
+            for k, v in sorted(settings.items()))
+        with self.pools_lock:
+            pool = self.pools.get(key)
+            if pool is None:
+                attached = dict(self.lazy_attach, **settings['attach'])
+                files = [dbfile]
+                for value in attached.values():
+                    if value.startswith('file:'):
+                        value = value[5:].split('?', 1)[0]
+                    files.append(value)
+                # idle connections are kept at most `pool_size`, and dropped
+                # once one of the database files is replaced
+                pool = self.pools[key] = utils.Pool(
+                    lambda: connect(
+                        dbfile, check_same_thread=False, **settings),
+                    maxsize=None, max_lifetime=None, maxidle=self.pool_size,
+                    reset=lambda db: reset_connection(db, attached),
+                    version=lambda: utils.file_version(*files))
+        return pool
+
     def apply(self, callback, route):
         # hack to support bottle v0.9.x
         if bottle.__version__.startswith('0.9'):
@@ -103,14 +238,9 @@ class SQLitePlugin(object):
 
         dbfile = g('dbfile', self.dbfile)
         autocommit = g('autocommit', self.autocommit)
-        dictrows = g('dictrows', self.dictrows)
         keyword = g('keyword', self.keyword)
-        text_factory = g('text_factory', self.text_factory)
-        readonly = g('readonly', self.readonly)
-        functions = g('functions', self.functions)
-        aggregates = g('aggregates', self.aggregates)
-        collations = g('collations', self.collations)
-        extensions = g('extensions', self.extensions)
+        pool = g('pool', self.pool)
+        settings = self.settings(g)
 
         # Test if the original callback accepts a 'db' keyword.
         # Ignore it if it does not need a database handle.
@@ -118,31 +248,15 @@ class SQLitePlugin(object):
         if keyword not in argspec.args:
             return callback
 
+        if pool:
+            pool = self.get_pool(dbfile, settings)
+
         def wrapper(*args, **kwargs):
             # Connect to the database
-            if readonly:
-                # drive letters not transformed
-                urifn = dbfile.replace('?', '%3f').replace('#', '%23')
-                db = sqlite3.connect('file:%s?mode=ro' % urifn, uri=True)
+            if pool:
+                db = pool.acquire()
             else:
-                db = sqlite3.connect(dbfile)
-            # set text factory
-            db.text_factory = text_factory
-            # This enables column access by name: row['column_name']
-            if dictrows:
-                db.row_factory = sqlite3.Row
-            # Create user functions, aggregates and collations
-            for name, value in functions.items():
-                db.create_function(name, *value)
-            for name, value in aggregates.items():
-                db.create_aggregate(name, *value)
-            for name, value in collations.items():
-                db.create_collation(name, value)
-            if extensions:
-                db.enable_load_extension(True)
-                for name in extensions:
-                    db.execute("SELECT load_extension(?)", (name,))
-                db.enable_load_extension(False)
+                db = connect(dbfile, **settings)
             # Add the connection handle as a keyword argument.
             kwargs[keyword] = db
 
@@ -160,7 +274,10 @@ class SQLitePlugin(object):
                     db.commit()
                 raise
             finally:
-                db.close()
+                if pool:
+                    pool.release(db)
+                else:
+                    db.close()
             return rv
 
         # Replace the route callback with the wrapped one.
@@ -0,0 +1,215 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+'''
+Packs a word list into a minimized acyclic automaton (DAFSA), where words
+share their prefixes and suffixes, for the autocompleter in
+static/autocomplete.js.
+
+The packed form is the start node. A node is an optional '!' (a word ends
+here) and its edges, separated by ','. An edge is its label followed by
+its target node, which is one of:
+
+  (nothing)  the final node without edges
+  {node}     a node with one parent
+  [node]     a node with more parents, numbered from 0 in order of '['
+  :n         a reference to the [node] numbered n (base 36)
+
+Chains of nodes with one edge and one parent are merged into one edge with
+a longer label, so the first characters of the labels of a node are
+distinct.
+
+Words may not contain any of '!,{}[]:'.
+'''
+
+import string
+
+SEPARATORS = frozenset('!,{}[]:')
+DIGITS = string.digits + string.ascii_lowercase
+
+
+class Node(object):
+    __slots__ = ('final', 'edges')
+
+    def __init__(self):
+        self.final = False
+        self.edges = {}
+
+    def key(self):
+        return (self.final, tuple(
+            (c, id(child)) for c, child in sorted(self.edges.items())))
+
+
+def build(words):
+    '''Builds the minimized automaton of `words`, returns the start node.'''
+    root = Node()
+    register = {}
+    # (parent, char, child) along the last word, not minimized yet
+    unchecked = []
+
+    def minimize(downto):
+        while len(unchecked) > downto:
+            parent, c, child = unchecked.pop()
+            key = child.key()
+            if key in register:
+                parent.edges[c] = register[key]
+            else:
+                register[key] = child
+
+    prev = ''
+    for word in sorted(set(words)):
+        common = 0
+        for a, b in zip(prev, word):
+            if a != b:
+                break
+            common += 1
+        minimize(common)
+        node = unchecked[-1][2] if unchecked else root
+        for c in word[common:]:
+            child = Node()
+            node.edges[c] = child
+            unchecked.append((node, c, child))
+            node = child
+        node.final = True
+        prev = word
+    minimize(0)
+    return root
+
+
+def base36(num):
+    s = ''
+    while True:
+        num, r = divmod(num, 36)
+        s = DIGITS[r] + s
+        if not num:
+            return s
+
+
+def pack(words):
+    '''Returns the packed automaton of `words` as a string.'''
+    words = list(words)
+    for word in words:
+        if not SEPARATORS.isdisjoint(word):
+            raise ValueError('invalid word: %r' % word)
+    root = build(words)
+    indegree = {}
+    stack = [root]
+    seen = {id(root)}
+    while stack:
+        node = stack.pop()
+        for child in node.edges.values():
+            indegree[id(child)] = indegree.get(id(child), 0) + 1
+            if id(child) not in seen:
+                seen.add(id(child))
+                stack.append(child)
+
+    numbers = {}
+    out = []
+
+    def write(node):
+        if node.final:
+            out.append('!')
+        for i, (c, child) in enumerate(sorted(node.edges.items())):
+            if i:
+                out.append(',')
+            label = c
+            while (not child.final and len(child.edges) == 1
+                   and indegree[id(child)] == 1):
+                (c, child), = child.edges.items()
+                label += c
+            out.append(label)
+            if child.final and not child.edges:
+                continue
+            num = numbers.get(id(child))
+            if num is not None:
+                out.append(':' + base36(num))
+            elif indegree[id(child)] > 1:
+                numbers[id(child)] = len(numbers)
+                out.append('[')
+                write(child)
+                out.append(']')
+            else:
+                out.append('{')
+                write(child)
+                out.append('}')
+
+    write(root)
+    return ''.join(out)
+
+
+def unpack(packed):
+    '''Returns the start node of a packed automaton. A node is
+    (final, [(label, target), ...]), where the target of an edge to the
+    final node without edges is None.'''
+    shared = []
+    pos = 0
+
+    def read(node):
+        nonlocal pos
+        if packed.startswith('!', pos):
+            node[0] = True
+            pos += 1
+        while pos < len(packed) and packed[pos] not in '}]':
+            if packed[pos] == ',':
+                pos += 1
+            start = pos
+            while pos < len(packed) and packed[pos] not in ',{}[]:':
+                pos += 1
+            label = packed[start:pos]
+            c = packed[pos:pos+1]
+            target = None
+            if c == ':':
+                start = pos = pos + 1
+                while pos < len(packed) and packed[pos] not in ',}]':
+                    pos += 1
+                target = shared[int(packed[start:pos], 36)]
+            elif c in ('{', '['):
+                target = [False, []]
+                if c == '[':
+                    shared.append(target)
+                pos += 1
+                read(target)
+                pos += 1
+            node[1].append((label, target))
+        return node
+
+    return read([False, []])
+
+
+def _walk(node, prefix):
+    if node is None:
+        yield prefix
+        return
+    final, edges = node
+    if final:
+        yield prefix
+    for label, target in edges:
+        yield from _walk(target, prefix + label)
+
+
+def words(packed):
+    '''Returns the words of a packed automaton in sorted order.'''
+    return list(_walk(unpack(packed), ''))
+
+
+def complete(root, term):
+    '''Returns the words of the unpacked automaton `root` that start with
+    `term`. As in autocomplete.js, if `term` continues past a word which is
+    not the prefix of another word, that word is returned.'''
+    node = root
+    pos = 0
+    while pos < len(term):
+        if node is None:
+            return [term[:pos]]
+        for label, target in node[1]:
+            if label[0] == term[pos]:
+                break
+        else:
+            return []
+        if not label.startswith(term[pos:pos+len(label)]):
+            return []
+        node = target
+        if pos + len(label) > len(term):
+            return list(_walk(node, term[:pos] + label))
+        pos += len(label)
+    return list(_walk(node, term))
@@ -0,0 +1,88 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+'''
+Adds derived, indexed columns to abbs.db after each import.
+
+dpkg_packages.version_key and package_versions.version_key hold
+dpkg_sortkey() of the (full) version, so that the latest version of a
+package is an index lookup, and versions compare without a collation.
+fts_names is a trigram index of package names, for substring searches.
+main.py only uses these if they are complete.
+
+The sortkeys row of the dbindex table marks the version_key columns as
+up to date. Triggers delete it when the importer adds or changes versions,
+until dbindex.py runs again.
+
+Usage: dbindex.py [abbs.db]
+'''
+
+import sys
+import sqlite3
+
+SQL_SORTKEY_COLUMNS = (
+    ('dpkg_packages', 'dpkg_sortkey(version)'),
+    ('package_versions', 'dpkg_sortkey(dpkg_version(version, release, epoch))'),
+)
+
+SQL_INDICES = (
+    'CREATE INDEX IF NOT EXISTS idx_dpkg_packages_key '
+    'ON dpkg_packages (repo, package, version_key)',
+    'CREATE INDEX IF NOT EXISTS idx_package_versions_key '
+    'ON package_versions (package, branch, version_key)',
+)
+
+SQL_MARKER = (
+    'CREATE TABLE IF NOT EXISTS dbindex (name TEXT PRIMARY KEY, updated INTEGER)'
+)
+
+SQL_TRIGGERS = tuple(
+    'CREATE TRIGGER IF NOT EXISTS dbindex_%s_%s AFTER %s ON %s '
+    "BEGIN DELETE FROM dbindex WHERE name='sortkeys'; END"
+    % (table, event.split()[0].lower(), event, table)
+    for table, events in (
+        ('dpkg_packages', ('INSERT', 'UPDATE OF version')),
+        ('package_versions',
+         ('INSERT', 'UPDATE OF version, release, epoch')),
+    ) for event in events
+)
+
+def add_sortkeys(db):
+    db.execute(SQL_MARKER)
+    for sql in SQL_TRIGGERS:
+        db.execute(sql)
+    for table, expr in SQL_SORTKEY_COLUMNS:
+        columns = [row[1] for row in db.execute('PRAGMA table_info(%s)' % table)]
+        if 'version_key' not in columns:
+            db.execute('ALTER TABLE %s ADD COLUMN version_key BLOB' % table)
+        # package_versions is updated in place
+        db.execute('UPDATE %s SET version_key = %s WHERE version_key IS NOT %s'
+                   % (table, expr, expr))
+    for sql in SQL_INDICES:
+        db.execute(sql)
+    db.execute("INSERT OR REPLACE INTO dbindex VALUES "
+               "('sortkeys', strftime('%s', 'now'))")
+
+def add_trigrams(db):
+    try:
+        db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS fts_names "
+                   "USING fts5(name, tokenize='trigram')")
+    except sqlite3.OperationalError as ex:
+        # the trigram tokenizer needs SQLite 3.34
+        print('dbindex.py: skipping fts_names: %s' % ex, file=sys.stderr)
+        return
+    db.execute('DELETE FROM fts_names')
+    db.execute('INSERT INTO fts_names (name) SELECT name FROM packages')
+
+def main(filename):
+    db = sqlite3.connect(filename)
+    db.enable_load_extension(True)
+    db.load_extension('./mod_vercomp')
+    db.enable_load_extension(False)
+    with db:
+        add_sortkeys(db)
+        add_trigrams(db)
+    db.close()
+
+if __name__ == '__main__':
+    main(sys.argv[1] if len(sys.argv) > 1 else 'data/abbs.db')
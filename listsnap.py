@@ -0,0 +1,174 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+'''
+Writes /list.json into data/cache after each import, so that main.py
+serves it from disk instead of querying abbs.db on every request.
+
+The snapshot is written as list.json, list.json.gz and, if the brotli
+module is available, list.json.br, and is listed in data/cache/dbhashs.
+Its hash there is the version of abbs.db it was made from: main.py only
+serves it while abbs.db is unchanged. Run it after dbindex.py.
+
+The last LIST_HISTORY_SIZE snapshots are kept in list-history/, listed
+with their versions and last_modified times in list-history/index. For
+each of them, list-since/<key>.json holds the packages added or changed
+since then and the names of the removed ones, for /list.json?since=<key>,
+where the key is the version or the last_modified time of the snapshot.
+If several snapshots have the same last_modified time, that key gives
+the changes since the oldest of them.
+
+Usage: listsnap.py (from the source directory)
+'''
+
+import os
+import gzip
+import json
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+import main
+
+LIST_HISTORY_DIR = 'list-history'
+LIST_HISTORY_SIZE = 16
+
+
+def write_file(filename, data, modified):
+    tmpname = filename + '.tmp'
+    with open(tmpname, 'wb') as f:
+        f.write(data)
+    # the Last-Modified of the response
+    os.utime(tmpname, (modified, modified))
+    os.replace(tmpname, filename)
+
+
+def remove_file(filename):
+    try:
+        os.unlink(filename)
+    except FileNotFoundError:
+        pass
+
+
+def write_variants(filename, body, modified):
+    ''' Writes `body` and its compressed variants for main.py. '''
+    variants = {'gzip': gzip.compress(body, 9, mtime=modified)}
+    if brotli is not None:
+        variants['br'] = brotli.compress(body, brotli.MODE_TEXT)
+    write_file(filename, body, modified)
+    for coding, ext in main.SNAPSHOT_CODINGS:
+        if coding in variants:
+            write_file(filename + ext, variants[coding], modified)
+        else:
+            remove_file(filename + ext)
+    return variants
+
+
+def update_dbhashs(cachedir, filename, size, fhash):
+    dbhashs = os.path.join(cachedir, 'dbhashs')
+    lines = []
+    try:
+        with open(dbhashs, 'r', encoding='utf-8') as f:
+            for ln in f:
+                if ln.strip() and ln.strip().split(' ', 2)[2] != filename:
+                    lines.append(ln.rstrip('\n'))
+    except FileNotFoundError:
+        pass
+    lines.append('%d %s %s' % (size, fhash, filename))
+    tmpname = dbhashs + '.tmp'
+    with open(tmpname, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(tmpname, dbhashs)
+
+
+def read_history(historydir):
+    ''' Returns [(version, last_modified), ...], oldest first. '''
+    history = []
+    try:
+        with open(os.path.join(historydir, 'index'), 'r',
+                  encoding='utf-8') as f:
+            for ln in f:
+                if ln.strip():
+                    version, modified = ln.split()
+                    history.append((version, int(modified)))
+    except FileNotFoundError:
+        pass
+    return history
+
+
+def update_history(historydir, version, modified, gzbody):
+    ''' Adds the current snapshot to the history and drops the oldest ones.
+    Returns the new history. '''
+    os.makedirs(historydir, exist_ok=True)
+    history = [item for item in read_history(historydir)
+               if item[0] != version]
+    history.append((version, modified))
+    for old_version, old_modified in history[:-LIST_HISTORY_SIZE]:
+        remove_file(os.path.join(historydir, old_version + '.json.gz'))
+    history = history[-LIST_HISTORY_SIZE:]
+    write_file(os.path.join(historydir, version + '.json.gz'), gzbody,
+               modified)
+    tmpname = os.path.join(historydir, 'index.tmp')
+    with open(tmpname, 'w', encoding='utf-8') as f:
+        for item in history:
+            f.write('%s %d\n' % item)
+    os.replace(tmpname, os.path.join(historydir, 'index'))
+    return history
+
+
+def delta(old, packages):
+    ''' Returns the packages added or changed since `old`, and the names of
+    the removed ones. Both take {name: package}. '''
+    changed = [package for name, package in sorted(packages.items())
+               if old.get(name) != package]
+    removed = sorted(name for name in old if name not in packages)
+    return changed, removed
+
+
+def write_deltas(cachedir, history, version, modified, packages):
+    historydir = os.path.join(cachedir, LIST_HISTORY_DIR)
+    deltadir = os.path.join(cachedir, main.LIST_DELTA_DIR)
+    os.makedirs(deltadir, exist_ok=True)
+    written = set()
+    # newest first, so that the oldest snapshot wins a last_modified key
+    for old_version, old_modified in reversed(history):
+        with gzip.open(os.path.join(historydir, old_version + '.json.gz'),
+                       'rb') as f:
+            old = {package['name']: package
+                   for package in json.load(f)['packages']}
+        changed, removed = delta(old, packages)
+        for key in (old_version, str(old_modified)):
+            body = json.dumps({
+                'last_modified': modified, 'version': version,
+                'since': key, 'packages': changed, 'removed': removed,
+            }, sort_keys=True).encode('utf-8')
+            filename = key + '.json'
+            write_variants(os.path.join(deltadir, filename), body, modified)
+            written.add(filename)
+    for filename in os.listdir(deltadir):
+        if filename.split('.', 1)[0] + '.json' not in written:
+            remove_file(os.path.join(deltadir, filename))
+
+
+def snapshot(cachedir):
+    # taken first: if abbs.db changes meanwhile, the snapshot is not used
+    version = main.list_snapshot_version()
+    with main.plugin.connection() as db:
+        modified = main.db_last_modified(db)
+    body = b''.join(main.stream_pkg_list(modified))
+    packages = {package['name']: package
+                for package in json.loads(body.decode('utf-8'))['packages']}
+
+    os.makedirs(cachedir, exist_ok=True)
+    variants = write_variants(
+        os.path.join(cachedir, main.LIST_SNAPSHOT), body, modified)
+    history = update_history(os.path.join(cachedir, LIST_HISTORY_DIR),
+                             version, modified, variants['gzip'])
+    write_deltas(cachedir, history, version, modified, packages)
+    update_dbhashs(cachedir, main.LIST_SNAPSHOT, len(body), version)
+
+
+if __name__ == '__main__':
+    snapshot(main.CACHE_DIR)
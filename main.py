@@ -7,8 +7,12 @@ import time
 import json
 import gzip
 import html
+import heapq
+import bisect
+import hashlib
 import pickle
 import sqlite3
+import inspect
 import operator
 import textwrap
 import itertools
@@ -16,6 +20,7 @@ import functools
 import contextlib
 import subprocess
 import collections
+import urllib.parse
 
 import jinja2
 import bottle
@@ -23,8 +28,14 @@ import psycopg2
 import psycopg2.extras
 
 import utils
+import dafsa
 import bottle_sqlite
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 __version__ = '3.1.2'
 
 SQL_GET_PACKAGES = 'SELECT name, description, full_version FROM v_packages'
@@ -80,8 +91,6 @@ WHERE v.package = ?
 ORDER BY b.priority DESC
 '''
 
-SQL_ATTACH_PISS = "ATTACH 'file:data/piss.db?mode=ro' AS piss"
-
 SQL_GET_PISS_VERSION = '''
 SELECT version, updated, url FROM piss.v_package_upstream WHERE package=?
 '''
@@ -150,6 +159,7 @@ LEFT JOIN v_dpkg_packages_new dpkg
   ON dpkg.package = p.name
 WHERE dpkg.repo = ?
   AND ((spabhost.value IS 'noarch') = (dpkg.architecture IS 'noarch'))
+  AND p.name > ?
 ORDER BY p.name
 '''
 
@@ -176,11 +186,9 @@ LIMIT ?
 
 SQL_GET_PACKAGE_LAGGING = '''
 SELECT
-  p.name name, dpkg.dpkg_version dpkg_version, description,
-  ((CASE WHEN ifnull(pv.epoch, '') = '' THEN ''
-    ELSE pv.epoch || ':' END) || pv.version ||
-   (CASE WHEN ifnull(pv.release, '') IN ('', '0') THEN ''
-    ELSE '-' || pv.release END)) full_version
+  p.name name, max_vercomp(dpkg.dpkg_version) dpkg_version, description,
+  argmax_vercomp(dpkg.dpkg_version,
+    dpkg_version(pv.version, pv.release, pv.epoch)) full_version
 FROM packages p
 LEFT JOIN package_spec spabhost
   ON spabhost.package = p.name AND spabhost.key = 'ABHOST'
@@ -191,10 +199,35 @@ LEFT JOIN package_versions pv
 WHERE dpkg.repo = ? AND
   dpkg_version IS NOT null AND
   (dpkg.architecture IS 'noarch' OR ? != 'noarch') AND
-  ((spabhost.value IS 'noarch') = (dpkg.architecture IS 'noarch'))
-GROUP BY name
-HAVING (max(dpkg_version COLLATE vercomp) < full_version COLLATE vercomp)
-ORDER BY name
+  ((spabhost.value IS 'noarch') = (dpkg.architecture IS 'noarch')) AND
+  p.name > ?
+GROUP BY p.name
+HAVING max_vercomp(dpkg.dpkg_version) < argmax_vercomp(dpkg.dpkg_version,
+  dpkg_version(pv.version, pv.release, pv.epoch)) COLLATE vercomp
+ORDER BY p.name
+'''
+
+SQL_GET_PACKAGE_LAGGING_KEY = '''
+SELECT
+  p.name name, dp.version dpkg_version, description,
+  dpkg_version(pv.version, pv.release, pv.epoch) full_version
+FROM (
+  SELECT package, version, max(version_key) version_key, architecture, repo
+  FROM dpkg_packages
+  WHERE repo = ?
+  GROUP BY package
+) dp
+INNER JOIN dpkg_repos dr ON dr.name = dp.repo
+INNER JOIN packages p ON p.name = dp.package
+LEFT JOIN package_spec spabhost
+  ON spabhost.package = p.name AND spabhost.key = 'ABHOST'
+INNER JOIN package_versions pv
+  ON pv.package = p.name AND pv.branch = dr.suite
+WHERE (dp.architecture IS 'noarch' OR ? != 'noarch') AND
+  ((spabhost.value IS 'noarch') = (dp.architecture IS 'noarch')) AND
+  dp.version_key < pv.version_key AND
+  p.name > ?
+ORDER BY p.name
 '''
 
 SQL_GET_PACKAGE_GHOST = '''
@@ -202,6 +235,7 @@ SELECT package name, dpkg_version
 FROM v_dpkg_packages_new
 WHERE repo = ? AND name NOT IN (SELECT name FROM packages)
 GROUP BY name
+ORDER BY name
 '''
 
 SQL_GET_PACKAGE_MISSING = '''
@@ -216,6 +250,7 @@ WHERE full_version IS NOT null AND dpkg_version IS null
   AND ((spabhost.value IS 'noarch') = (? IS 'noarch'))
   AND (EXISTS(SELECT 1 FROM dpkg_repos WHERE realname=? AND category='bsp') =
        (v_packages.tree_category='bsp'))
+  AND v_packages.name > ?
 ORDER BY name
 '''
 
@@ -230,7 +265,7 @@ SELECT
    ELSE -1 END, -2) ver_compare
 FROM v_packages
 LEFT JOIN v_dpkg_packages_new dpkg ON dpkg.package = v_packages.name
-WHERE tree = ?
+WHERE tree = ? AND name > ?
 GROUP BY name
 ORDER BY name
 '''
@@ -309,7 +344,7 @@ SELECT dp.filename, rtrim(
     THEN 'noarch' ELSE '' END, ',') removereason
 FROM dpkg_packages dp
 LEFT JOIN (
-  SELECT package, max(version COLLATE vercomp) version
+  SELECT package, max_vercomp(version) version
   FROM dpkg_packages
   WHERE repo = ?
   GROUP BY package
@@ -318,7 +353,7 @@ LEFT JOIN packages ON packages.name = dp.package
 LEFT JOIN package_spec spabhost
   ON spabhost.package = dp.package AND spabhost.key = 'ABHOST'
 LEFT JOIN (
-  SELECT dp.package, max(dp.version COLLATE vercomp) version
+  SELECT dp.package, max_vercomp(dp.version) version
   FROM dpkg_packages dp
   INNER JOIN dpkg_repos dr ON dr.name=dp.repo
   WHERE dr.architecture = 'noarch'
@@ -341,7 +376,7 @@ SELECT dp.filename, rtrim(
     THEN 'hasarch' ELSE '' END, ',') removereason
 FROM dpkg_packages dp
 LEFT JOIN (
-  SELECT package, max(version COLLATE vercomp) version
+  SELECT package, max_vercomp(version) version
   FROM dpkg_packages
   WHERE repo = ?
   GROUP BY package
@@ -350,7 +385,7 @@ LEFT JOIN packages ON packages.name = dp.package
 LEFT JOIN package_spec spabhost
   ON spabhost.package = dp.package AND spabhost.key = 'ABHOST'
 LEFT JOIN (
-  SELECT dp.package, max(dp.version COLLATE vercomp) version
+  SELECT dp.package, max_vercomp(dp.version) version
   FROM dpkg_packages dp
   INNER JOIN dpkg_repos dr ON dr.name=dp.repo
   WHERE dr.architecture != 'noarch'
@@ -365,6 +400,43 @@ SELECT filename, 'dup' removereason FROM dpkg_package_duplicate WHERE repo=?
 ORDER BY filename
 '''
 
+SQL_CHECK_SORTKEYS = '''
+SELECT 1 FROM sqlite_master, dbindex
+WHERE sqlite_master.name IN ('idx_dpkg_packages_key', 'idx_package_versions_key')
+  AND dbindex.name='sortkeys'
+'''
+
+SQL_GET_PACKAGE_UNINSTALLABLE = '''
+SELECT
+  dp.package name, max_vercomp(dp.version) dpkg_version,
+  pd.dependency dependency,
+  coalesce(pd.relop, '') || coalesce(pd.version, '') requirement,
+  (SELECT max_vercomp(a.version) FROM dpkg_packages a
+   WHERE a.package = pd.dependency AND instr(?3, ',' || a.repo || ',')) available
+FROM dpkg_packages dp
+INNER JOIN package_dependencies pd
+  ON pd.package = dp.package AND pd.relationship = 'PKGDEP'
+  AND pd.architecture = (CASE WHEN EXISTS(
+    SELECT 1 FROM package_dependencies pda
+    WHERE pda.package = dp.package AND pda.relationship = 'PKGDEP'
+    AND pda.architecture = ?2) THEN ?2 ELSE '' END)
+WHERE dp.repo = ?1
+  AND NOT EXISTS(
+    SELECT 1 FROM dpkg_packages a
+    WHERE a.package = pd.dependency AND instr(?3, ',' || a.repo || ',')
+    AND (pd.version IS NULL
+      OR compare_dpkgrel(a.version, pd.relop, pd.version)))
+  AND NOT EXISTS(
+    SELECT 1 FROM package_dependencies prov
+    INNER JOIN dpkg_packages a ON a.package = prov.package
+    WHERE prov.dependency = pd.dependency AND prov.relationship = 'PKGPROV'
+    AND prov.architecture IN ('', ?2) AND instr(?3, ',' || a.repo || ',')
+    AND (pd.version IS NULL
+      OR compare_dpkgrel(prov.version, pd.relop, pd.version)))
+GROUP BY dp.package, pd.dependency
+ORDER BY dp.package, pd.dependency
+'''
+
 SQL_GET_PACKAGE_REV_REL = '''
 SELECT
   package, coalesce(relop, '') || coalesce(version, '') version,
@@ -375,12 +447,23 @@ AND relationship IN ('PKGDEP', 'BUILDDEP', 'PKGRECOM', 'PKGSUG')
 ORDER BY relationship, package, architecture
 '''
 
+SQL_GET_PACKAGE_NAMES = '''
+SELECT p.name, max(pv.commit_time) commit_time
+FROM packages p
+LEFT JOIN package_versions pv ON pv.package=p.name
+GROUP BY p.name
+UNION ALL
+SELECT DISTINCT package, NULL FROM dpkg_packages
+WHERE package NOT IN (SELECT name FROM packages)
+ORDER BY 1
+'''
+
 SQL_SEARCH_PACKAGES_DESC = '''
-SELECT q.name, q.description, q.desc_highlight, vp.full_version
+SELECT q.name, q.description, vp.full_version, q.fts_rowid,
+  count(*) OVER () total
 FROM (
   SELECT
-    vp.name, vp.description,
-    highlight(fts_packages, 1, '<b>', '</b>') desc_highlight,
+    vp.name, vp.description, fp.rowid fts_rowid,
     (CASE WHEN vp.name=? THEN 1
      WHEN instr(vp.name, ?)=0 THEN 3 ELSE 2 END) matchcls,
     bm25(fts_packages, 5, 1) ftrank
@@ -389,14 +472,53 @@ FROM (
   WHERE fts_packages MATCH ?
   UNION ALL
   SELECT
-    vp.name, vp.description, vp.description desc_highlight,
+    vp.name, vp.description, NULL fts_rowid,
     2 matchcls, 1.0 ftrank
-  FROM v_packages vp
-  LEFT JOIN fts_packages fp ON fp.name=vp.name AND fts_packages MATCH ?
-  WHERE vp.name LIKE ('%' || ? || '%') AND vp.name!=? AND fp.name IS NULL
+  FROM packages vp
+  WHERE vp.name LIKE ('%' || ? || '%') AND vp.name!=? AND vp.name NOT IN (
+    SELECT name FROM fts_packages WHERE fts_packages MATCH ?)
 ) q
 INNER JOIN v_packages vp ON vp.name=q.name
 ORDER BY q.matchcls, q.ftrank, vp.commit_time DESC, q.name
+LIMIT ? OFFSET ?
+'''
+
+# with the trigram index of names from dbindex.py
+SQL_SEARCH_PACKAGES_DESC_TRIGRAM = '''
+SELECT q.name, q.description, vp.full_version, q.fts_rowid,
+  count(*) OVER () total
+FROM (
+  SELECT
+    vp.name, vp.description, fp.rowid fts_rowid,
+    (CASE WHEN vp.name=? THEN 1
+     WHEN instr(vp.name, ?)=0 THEN 3 ELSE 2 END) matchcls,
+    bm25(fts_packages, 5, 1) ftrank
+  FROM packages vp
+  INNER JOIN fts_packages fp ON fp.name=vp.name
+  WHERE fts_packages MATCH ?
+  UNION ALL
+  SELECT
+    vp.name, vp.description, NULL fts_rowid,
+    2 matchcls, 1.0 ftrank
+  FROM fts_names fn
+  INNER JOIN packages vp ON vp.name=fn.name
+  WHERE fn.name LIKE ('%' || ? || '%') AND fn.name!=? AND fn.name NOT IN (
+    SELECT name FROM fts_packages WHERE fts_packages MATCH ?)
+) q
+INNER JOIN v_packages vp ON vp.name=q.name
+ORDER BY q.matchcls, q.ftrank, vp.commit_time DESC, q.name
+LIMIT ? OFFSET ?
+'''
+
+SQL_CHECK_TRIGRAMS = '''
+SELECT EXISTS(SELECT name FROM packages EXCEPT SELECT name FROM fts_names) OR
+  EXISTS(SELECT name FROM fts_names EXCEPT SELECT name FROM packages)
+'''
+
+SQL_SEARCH_HIGHLIGHT = '''
+SELECT rowid, highlight(fts_packages, 1, '<b>', '</b>')
+FROM fts_packages
+WHERE fts_packages MATCH ? AND rowid IN (%s)
 '''
 
 SQL_ISSUES_STATS = '''
@@ -545,15 +667,118 @@ RE_FTS5_COLSPEC = re.compile(r'(?<!")(\w*-[\w-]*)(?!")')
 RE_SRCHOST = re.compile(r'^https://(github\.com|bitbucket\.org|gitlab\.com)')
 RE_PYPI = re.compile(r'^https?://pypi\.(python\.org|io)')
 RE_PYPISRC = re.compile(r'^https?://pypi\.(python\.org|io)/packages/source/')
+# a last_modified time or an abbs.db version for /list.json?since=
+RE_SNAPSHOT_KEY = re.compile(r'^[0-9a-f]{1,40}$')
+
+DB_FILES = ('data/abbs.db', 'data/piss.db')
+
+CACHE_DIR = 'data/cache'
+# written by listsnap.py, with compressed variants
+LIST_SNAPSHOT = 'list.json'
+# changes since earlier snapshots, named by their keys
+LIST_DELTA_DIR = 'list-since'
+SNAPSHOT_CODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+# seconds, 0 to compute cached summaries on demand only
+CACHE_REFRESH = int(os.environ.get('CACHE_REFRESH', 0))
 
 PG_CONN = os.environ.get('PGCONN', '')
+PG_POOL_SIZE = int(os.environ.get('PG_POOL_SIZE', 4))
+PG_POOL_TIMEOUT = 10
+PG_POOL_LIFETIME = 3600
+PG_POOL_PING = 30
+
+# /api/complete
+COMPLETE_LIMIT = 20
+COMPLETE_MAX_LIMIT = 100
+
+# "did you mean" suggestions for missing packages
+SUGGEST_LIMIT = 5
+
+# bytes per chunk of streamed responses
+STREAM_CHUNK_SIZE = 64 << 10
+
+# number of cached /search/ result pages
+SEARCH_CACHE_SIZE = 256
+
+# bytes, 0 to disable the rendered response cache
+RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', 64 << 20))
+
+
+class ResponseCachePlugin(object):
+    ''' Caches rendered responses of routes that take a `db` argument, and
+    handles conditional requests for them.
+
+    The key is (path, normalized query string, render type, db_version()),
+    so entries are never outdated. The ETag is a hash of the key, which is
+    known before the route runs, so If-None-Match is answered with 304
+    without touching the database. Only 200 responses returned as strings
+    or JSON dicts are cached, and only if no outdated `utils.versioned`
+    result went into them. Routes showing data from other sources should
+    skip this plugin.
+    '''
+
+    name = 'respcache'
+    api = 2
+
+    def __init__(self, maxbytes, keyword='db'):
+        self.keyword = keyword
+        self.cache = utils.LRUCache(maxbytes,
+            lambda entry: len(entry[1]) + 256)
+
+    def apply(self, callback, route):
+        argspec = inspect.getfullargspec(route.callback)
+        if self.keyword not in argspec.args or route.method != 'GET':
+            return callback
+
+        def wrapper(*args, **kwargs):
+            request = bottle.request
+            key = (request.path, urllib.parse.urlencode(
+                   sorted(request.query.allitems())),
+                   render_type(), db_version())
+            etag = '"%s"' % hashlib.sha1(repr(key).encode('utf-8')
+                                         ).hexdigest()[:24]
+            headers = {'ETag': etag, 'Vary': 'X-Requested-With'}
+            check = request.environ.get('HTTP_IF_NONE_MATCH')
+            if check and (check.strip() == '*' or etag in (
+                    tag.strip().lstrip('W/') for tag in check.split(','))):
+                return bottle.HTTPResponse(status=304, **headers)
+            entry = self.cache.get(key)
+            if entry is not None:
+                headerlist, body = entry
+                for name, value in headerlist:
+                    bottle.response.set_header(name, value)
+                return body
+            with utils.track_stale() as used:
+                rv = callback(*args, **kwargs)
+            if isinstance(rv, dict):
+                bottle.response.content_type = 'application/json'
+                rv = json.dumps(rv)
+            if isinstance(rv, str):
+                rv = rv.encode(bottle.response.charset)
+            # a page made from outdated summaries does not match the key
+            if (isinstance(rv, bytes) and bottle.response.status_code == 200
+                    and not used.stale):
+                for name, value in headers.items():
+                    bottle.response.set_header(name, value)
+                self.cache.set(key, (bottle.response.headerlist, rv))
+            return rv
+
+        return wrapper
+
 
 application = app = bottle.Bottle()
+respcache = ResponseCachePlugin(RESPONSE_CACHE_SIZE)
+app.install(respcache)
 plugin = bottle_sqlite.Plugin(
     dbfile='data/abbs.db',
     readonly=True,
-    extensions=('./mod_vercomp',)
+    extensions=('./mod_vercomp',),
     # collations={'vercomp': utils.version_compare}
+    pool=True,
+    pool_size=int(os.environ.get('SQLITE_POOL_SIZE', 8)),
+    # upstream versions, attached by the routes that show them
+    lazy_attach={'piss': 'file:data/piss.db?mode=ro'},
 )
 app.install(plugin)
 
@@ -586,6 +811,16 @@ def response_lm(f_body=None, status=None, headers=None, modified=None, etag=None
     return bottle.HTTPResponse(body, status, **headers)
 
 
+def query_args(**params):
+    ''' The query string of the current request, with `params` replaced.
+    Page numbers and keyset pagination exclude each other. '''
+    query = [(key, value) for key, value
+             in bottle.request.query.decode().allitems()
+             if key not in params and key not in ('page', 'after')]
+    query.extend(params.items())
+    return '?' + urllib.parse.urlencode(query)
+
+
 jinja2_settings = {
     'filters': {
         'strftime': utils.strftime,
@@ -601,8 +836,13 @@ jinja2_settings = {
         'dep_rel': DEP_REL,
         'dep_rel_rev': DEP_REL_REV,
         'issue_code': ISSUE_CODE,
+        'db_version': lambda: db_version(),
+        'query_args': query_args,
     },
-    'autoescape': jinja2.select_autoescape(('html', 'htm', 'xml'))
+    'autoescape': jinja2.select_autoescape(('html', 'htm', 'xml')),
+    # bottle's loader reports templates as outdated, which would recompile
+    # extended and included templates on every render
+    'auto_reload': False,
 }
 jinja2_template = functools.partial(bottle.jinja2_template,
     template_settings=jinja2_settings)
@@ -634,10 +874,39 @@ def render(template, alt=None, *args, **kwargs):
     return jinja2_template(template, *args, **kwargs)
 
 
-def get_pgconn():
+def pg_connect():
     db = psycopg2.connect(PG_CONN, cursor_factory=psycopg2.extras.DictCursor)
     db.set_session(readonly=True)
-    return contextlib.closing(db)
+    return db
+
+
+def pg_check(db, idle):
+    if db.closed or (db.get_transaction_status() !=
+                     psycopg2.extensions.TRANSACTION_STATUS_IDLE):
+        return False
+    if idle > PG_POOL_PING:
+        with db.cursor() as cur:
+            cur.execute('SELECT 1')
+        db.rollback()
+    return True
+
+
+pgpool = utils.Pool(
+    pg_connect, maxsize=PG_POOL_SIZE, timeout=PG_POOL_TIMEOUT,
+    max_lifetime=PG_POOL_LIFETIME, check=pg_check,
+    reset=lambda db: db.rollback())
+
+
+@contextlib.contextmanager
+def get_pgconn():
+    try:
+        db = pgpool.acquire()
+    except utils.PoolTimeout:
+        raise bottle.HTTPError(503, "Too many concurrent requests.")
+    try:
+        yield db
+    finally:
+        pgpool.release(db)
 
 
 def gen_trie(wordlist):
@@ -652,6 +921,66 @@ def gen_trie(wordlist):
     return trie
 
 
+def db_version():
+    ''' Changes when any of the SQLite databases is replaced. '''
+    return utils.file_version(*DB_FILES)
+
+
+@utils.versioned(db_version, maxsize=1)
+def db_pkgtrie(db):
+    ''' Renders pkgtrie.js once per database version. Returns the ETag, the
+    modified time and the body for each available content coding. '''
+    body = jinja2_template('pkgtrie.js', packagetrie=json.dumps(dafsa.pack(
+        row[0] for row in db.execute('SELECT name FROM packages')))
+        ).encode('utf-8')
+    variants = {None: body, 'gzip': gzip.compress(body, 9)}
+    if brotli is not None:
+        variants['br'] = brotli.compress(body, brotli.MODE_TEXT)
+    etag = '"%s"' % hashlib.sha1(body).hexdigest()[:24]
+    return etag, db_last_modified(db), variants
+
+
+@utils.versioned(db_version, maxsize=1024)
+def db_count(db, sql, params):
+    return db.execute('SELECT count(*) FROM (%s)' % sql, params).fetchone()[0]
+
+
+@utils.remember(600)
+def pg_count(db, sql, params):
+    db.execute('SELECT count(*) FROM (%s) q' % sql, params)
+    return db.fetchone()[0]
+
+
+def db_pager(db, sql, params, pagesize, page, key=None, after=None):
+    ''' Pages through a query with LIMIT/OFFSET.
+
+    With `key`, the query must be sorted by that column, and take a lower
+    bound for it as the last parameter. Then `after` selects the page right
+    after the given key (keyset pagination), and the pager reports the key
+    for the next page.
+    '''
+    if key is None:
+        return utils.QueryPager(
+            lambda limit, offset: db.execute(
+                sql + ' LIMIT ? OFFSET ?', params + (limit, offset)),
+            lambda: db_count(db, sql, params), pagesize, page)
+    if after is not None:
+        page = 1
+    return utils.QueryPager(
+        lambda limit, offset: db.execute(
+            sql + ' LIMIT ? OFFSET ?', params + (after or '', limit, offset)),
+        lambda: db_count(db, sql, params + ('',)), pagesize, page,
+        operator.itemgetter(key), after)
+
+
+def pg_pager(cur, sql, params, pagesize, page):
+    def query(limit, offset):
+        cur.execute(sql + ' LIMIT %s OFFSET %s', params + (limit, offset))
+        return cur
+    return utils.QueryPager(
+        query, lambda: pg_count(cur, sql, params), pagesize, page)
+
+
 def get_page():
     page_q = bottle.request.query.get('page')
     if not page_q:
@@ -664,10 +993,81 @@ def get_page():
         return 1, PAGESIZE
 
 
+def stream_page_all():
+    ''' Whether to stream a listing: ?page=all as TSV or JSON. '''
+    return (bottle.request.query.get('page') == 'all'
+            and render_type() in ('tsv', 'json'))
+
+
+@functools.lru_cache(maxsize=None)
+def stream_template(name):
+    ''' The Jinja2 template `name`, for Template.generate(). '''
+    return bottle.Jinja2Template(
+        name=name, lookup=bottle.TEMPLATE_PATH, **jinja2_settings).tpl
+
+
+def render_stream(template, pager, rowfunc=dict, error=None, **kwargs):
+    ''' Renders a listing like render(template, alt=('html', 'tsv'),
+    packages=..., page=...) with ?page=all, as TSV or JSON in chunks.
+
+    The rows come from iterating `pager(db)`, straight from the cursor.
+    The body is sent after the route callback has returned its connection,
+    so `pager` gets a connection of its own. `rowfunc` makes a package
+    from a row. Without rows, renders the `error` message instead, if any.
+    '''
+    rtype = render_type()
+    if rtype == 'json':
+        bottle.response.content_type = 'application/json'
+    else:
+        rtype = 'tsv'
+        bottle.response.content_type = template_mimetypes['tsv']
+
+    def json_parts(packages, res):
+        yield '{'
+        for key, value in kwargs.items():
+            yield '%s: %s, ' % (json.dumps(key), json.dumps(value))
+        yield '"packages": ['
+        sep = ''
+        for package in packages:
+            yield sep + json.dumps(package)
+            sep = ', '
+        # counted after the rows, like pagination() of a page
+        yield '], "page": %s}' % json.dumps(pagination(res))
+
+    def generate():
+        with plugin.connection() as db:
+            res = pager(db)
+            rows = iter(res)
+            first = next(rows, None)
+            if first is None and error is not None:
+                if rtype == 'json':
+                    yield json.dumps({'error': error}).encode('utf-8')
+                else:
+                    yield jinja2_template(
+                        'error.tsv', error=error).encode('utf-8')
+                return
+            if first is not None:
+                rows = itertools.chain((first,), rows)
+            packages = map(rowfunc, rows)
+            if rtype == 'json':
+                parts = json_parts(packages, res)
+            else:
+                parts = stream_template(template + '.tsv').generate(
+                    packages=packages, **kwargs)
+            yield from utils.iter_chunks(parts, STREAM_CHUNK_SIZE)
+
+    return generate()
+
+
 def pagination(pager):
     if pager is None:
         return {'cur': 1, 'max': 1, 'count': 0}
-    return {'cur': pager.page, 'max': pager.pagecount(), 'count': pager.count()}
+    d = {'cur': pager.page, 'max': pager.pagecount(), 'count': pager.count()}
+    if pager.key is not None:
+        d['next'] = pager.next
+        if pager.after is not None:
+            d['cur'] = None
+    return d
 
 
 def render_html(**kwargs):
@@ -683,7 +1083,7 @@ def render_html(**kwargs):
     return template.render(**kvars)
 
 
-@utils.remember(3600)
+@utils.versioned(db_version)
 def db_last_modified(db):
     row = db.execute('SELECT commit_time FROM package_versions '
                      'ORDER BY commit_time DESC LIMIT 1').fetchone()
@@ -693,15 +1093,144 @@ def db_last_modified(db):
         return 0
 
 
-@utils.remember(1800)
+@utils.versioned(db_version)
+def db_sortkeys(db):
+    ''' Whether dbindex.py has filled in the version_key columns, and no
+    version has been added or changed since. '''
+    if not db.execute("SELECT 1 FROM sqlite_master WHERE name='dbindex'"
+                      ).fetchone():
+        return False
+    return len(db.execute(SQL_CHECK_SORTKEYS).fetchall()) == 2
+
+
+@utils.versioned(db_version)
+def db_trigrams(db):
+    ''' Whether dbindex.py has built the trigram index of names. '''
+    if not db.execute("SELECT 1 FROM sqlite_master WHERE name='fts_names'"
+                      ).fetchone():
+        return False
+    return not db.execute(SQL_CHECK_TRIGRAMS).fetchone()[0]
+
+
+@utils.versioned(db_version)
 def db_repos(db):
     return collections.OrderedDict((row['name'], dict(row))
         for row in db.execute(SQL_GET_REPO_COUNT))
 
 
-@utils.remember(1800)
+def dep_sources(repos, repo):
+    ''' Repos that can satisfy dependencies of packages in `repo`. '''
+    r = repos[repo]
+    suites = {r['branch']}
+    if r['testing']:
+        suites.update(x['branch'] for x in repos.values()
+                      if x['realname'] == r['realname'] and not x['testing'])
+    # noarch packages may depend on packages of any architecture
+    realnames = (None if r['realname'] == 'noarch'
+                 else (r['realname'], 'noarch'))
+    return [name for name, x in repos.items() if x['branch'] in suites
+            and (realnames is None or x['realname'] in realnames)]
+
+
+@utils.versioned(db_version)
+def db_uninstallable(db, repo):
+    repos = db_repos(db)
+    sources = ',%s,' % ','.join(dep_sources(repos, repo))
+    return [dict(row) for row in db.execute(SQL_GET_PACKAGE_UNINSTALLABLE,
+        (repo, repos[repo]['architecture'], sources))]
+
+
+@utils.versioned(db_version, maxsize=1)
+def db_uninstallable_counts(db):
+    ''' Number of uninstallable packages in each repo, for /qa/. '''
+    return {repo: len(set(row['name'] for row in db_uninstallable(db, repo)))
+            for repo in db_repos(db)}
+
+
+@utils.versioned(db_version, maxsize=1)
+def db_names(db):
+    ''' Sorted names of packages and ghost packages, and their last commit
+    time (0 for ghosts), for prefix completion. '''
+    names = []
+    times = []
+    for name, commit_time in db.execute(SQL_GET_PACKAGE_NAMES):
+        names.append(name)
+        times.append(commit_time or 0)
+    return names, times
+
+
+@utils.versioned(db_version, maxsize=1)
+def db_name_set(db):
+    ''' Names of packages and ghost packages, to check for existence. '''
+    return frozenset(db_names(db)[0])
+
+
+@utils.versioned(db_version, maxsize=1)
+def db_name_index(db):
+    ''' Index of package and ghost package names, for suggestions. '''
+    return utils.SegmentIndex(db_names(db)[0], maxdist=2)
+
+
+def suggest_names(db, name):
+    ''' Names of packages close to `name`, nearest first. Allows one typo in
+    names of 3 to 5 characters. Longer names get the names within two typos
+    only if none is within one. '''
+    if len(name) < 3:
+        return []
+    index = db_name_index(db)
+    found = index.search(name, 1, SUGGEST_LIMIT)
+    if not found and len(name) > 5:
+        found = index.search(name, 2, SUGGEST_LIMIT)
+    return [x for dist, x in found]
+
+
+@utils.versioned(db_version, maxsize=SEARCH_CACHE_SIZE)
+def db_search(db, q, pagesize, page):
+    ''' Returns a page of search results and the total number of results.
+    Only the rows on the page are highlighted. '''
+    qesc = RE_FTS5_COLSPEC.sub(r'"\1"', q)
+    params = (qesc,)*6
+    sql = (SQL_SEARCH_PACKAGES_DESC_TRIGRAM if db_trigrams(db)
+           else SQL_SEARCH_PACKAGES_DESC)
+    try:
+        rows = (db.execute(sql, params + (
+                pagesize, (page-1) * pagesize)).fetchall() if page > 0 else [])
+        if rows:
+            total = rows[0]['total']
+        elif page == 1:
+            total = 0
+        else:
+            # past the last page
+            row = db.execute(sql, params + (1, 0)).fetchone()
+            total = row['total'] if row else 0
+    except sqlite3.OperationalError:
+        # fts5 syntax error
+        return [], 0
+    rowids = [row['fts_rowid'] for row in rows
+              if row['fts_rowid'] is not None]
+    highlights = {}
+    for i in range(0, len(rowids), 500):
+        chunk = rowids[i:i+500]
+        highlights.update(db.execute(SQL_SEARCH_HIGHLIGHT % ','.join(
+            '?' * len(chunk)), (qesc,) + tuple(chunk)))
+    packages = []
+    for row in rows:
+        packages.append({
+            'name': row['name'],
+            'description': row['description'],
+            'desc_highlight': html.escape(highlights.get(
+                row['fts_rowid'], row['description'])).replace(
+                '&lt;b&gt;', '<b>').replace('&lt;/b&gt;', '</b>'),
+            'full_version': row['full_version'],
+            'name_highlight': html.escape(row['name']).replace(
+                q, '<b>%s</b>' % q),
+        })
+    return packages, total
+
+
+@utils.versioned(db_version)
 def db_trees(db):
-    db.execute(SQL_ATTACH_PISS)
+    plugin.attach_lazy(db, 'piss')
     d = collections.OrderedDict((row['name'], dict(row))
         for row in db.execute(SQL_GET_TREES))
     return d
@@ -730,6 +1259,33 @@ def pg_issues():
     return totalcnt, ratio, cnt_src, cnt_deb, recent
 
 
+refresher = utils.Refresher(CACHE_REFRESH)
+
+
+@refresher.add
+def refresh_db_summaries():
+    with plugin.connection() as db:
+        db_last_modified.refresh(db)
+        db_repos.refresh(db)
+        db_trees.refresh(db)
+        db_uninstallable_counts.refresh(db)
+
+
+@refresher.add
+def refresh_pg_summaries():
+    pg_issues.refresh()
+
+
+if CACHE_REFRESH:
+    for fn in (db_last_modified, db_repos, db_trees, db_uninstallable_counts,
+               pg_issues):
+        fn.background = True
+
+    @app.hook('before_request')
+    def start_refresher():
+        refresher.start()
+
+
 def makefullver(epoch, version, release):
     v = version
     if epoch:
@@ -743,48 +1299,48 @@ def makefullver(epoch, version, release):
 def server_static(filename):
     return bottle.static_file(filename, root='static')
 
-@app.route('/pkgtrie.js')
+@app.route('/pkgtrie.js', skip=['respcache'])
 def pkgtrie(db):
-    return response_lm(lambda: jinja2_template(
-        'pkgtrie.js', packagetrie=RE_QUOTES.sub('\\1', json.dumps(gen_trie(
-        row[0] for row in db.execute('SELECT name FROM packages')),
-        separators=',:')).replace('{$:0}', '0')),
-        modified=db_last_modified(db),
-        headers={'Content-Type': 'application/javascript; charset=UTF-8'})
+    etag, modified, variants = db_pkgtrie(db)
+    encoding = utils.accept_encoding(
+        bottle.request.headers.get('Accept-Encoding'),
+        [coding for coding in ('br', 'gzip') if coding in variants])
+    headers = {
+        'Vary': 'Accept-Encoding',
+        'Content-Type': 'application/javascript; charset=UTF-8',
+        # versioned URLs from base.html never change
+        'Cache-Control': ('public, max-age=31536000, immutable'
+            if bottle.request.query.get('v') else 'public, max-age=86400'),
+    }
+    if encoding:
+        headers['Content-Encoding'] = encoding
+        # each coding is a different representation
+        etag = '%s-%s"' % (etag[:-1], encoding)
+    return response_lm(lambda: variants[encoding], headers=headers,
+                       modified=modified, etag=etag)
 
 @app.route('/search/')
 def search(db):
-    q = bottle.request.query.get('q')
+    q = ' '.join(bottle.request.query.get('q', '').split())
     noredir = bottle.request.query.get('noredir') or render_type() == 'json'
     page, pagesize = get_page()
     if not q:
         return render('search', alt=('html', 'tsv'),
             q=q, packages=[], page=pagination(None))
-    if not noredir:
-        qn = q.strip().lower().replace(' ', '-').replace('_', '-')
-        row = db.execute("SELECT 1 FROM packages WHERE name=?", (qn,)).fetchone()
-        if not row:
-            row = db.execute(SQL_GET_PACKAGE_INFO_GHOST, (qn,)).fetchone()
-        if row:
-            bottle.redirect("/packages/" + qn, 303)
-    packages = []
-    qesc = RE_FTS5_COLSPEC.sub(r'"\1"', q)
-    try:
-        rows = db.execute(SQL_SEARCH_PACKAGES_DESC, (qesc,)*6).fetchall()
-    except sqlite3.OperationalError:
-        # fts5 syntax error
-        rows = []
-    for row in rows:
-        d = dict(row)
-        d['desc_highlight'] = html.escape(d['desc_highlight']).replace(
-            '&lt;b&gt;', '<b>').replace('&lt;/b&gt;', '</b>')
-        d['name_highlight'] = html.escape(d['name']).replace(q, '<b>%s</b>' % q)
-        packages.append(d)
-    res = utils.Pager(packages, pagesize, page)
+    qn = q.strip().lower().replace(' ', '-').replace('_', '-')
+    if not noredir and qn in db_name_set(db):
+        bottle.redirect("/packages/" + qn, 303)
+    packages, total = db_search(db, q, pagesize, page)
+    res = utils.QueryPager(lambda limit, offset: packages, lambda: total,
+                           pagesize, page)
+    if not total:
+        return render('search', alt=('html', 'tsv'),
+            q=q, packages=[], page=pagination(res),
+            suggestions=suggest_names(db, qn))
     return render('search', alt=('html', 'tsv'),
         q=q, packages=list(res), page=pagination(res))
 
-@app.route('/query/', method=('GET', 'POST'))
+@app.route('/query/', method=('GET', 'POST'), skip=['respcache'])
 def query(db):
     q = bottle.request.forms.get('q')
     if not q:
@@ -815,14 +1371,17 @@ def process_db_dependency(dependency_row):
 @app.route('/packages/<name>')
 def package(name, db):
     name = name.strip().lower()
-    res = db.execute(SQL_GET_PACKAGE_INFO, (name,)).fetchone()
-    pkgintree = True
-    if res is None:
-        res = db.execute(SQL_GET_PACKAGE_INFO_GHOST, (name,)).fetchone()
-        pkgintree = False
+    res = None
+    if name in db_name_set(db):
+        res = db.execute(SQL_GET_PACKAGE_INFO, (name,)).fetchone()
+        pkgintree = True
+        if res is None:
+            res = db.execute(SQL_GET_PACKAGE_INFO_GHOST, (name,)).fetchone()
+            pkgintree = False
     if res is None:
         return bottle.HTTPResponse(render('error.html',
-                error='Package "%s" not found.' % name), 404)
+                error='Package "%s" not found.' % name,
+                suggestions=suggest_names(db, name)), 404)
     pkg = dict(res)
     # Process depenencies
     dep_dict = process_db_dependency(pkg['dependency'])
@@ -844,7 +1403,7 @@ def package(name, db):
             if ver not in ver_list:
                 ver_list.append(ver)
         dpkg_dict[repo] = table_row
-    ver_list.sort(key=utils.version_compare_key, reverse=True)
+    ver_list = utils.sort_versions(ver_list, reverse=True)
     if pkgintree and fullver and fullver not in ver_list:
         ver_list.insert(0, fullver)
     fail_arch = utils.parse_fail_arch(pkg['fail_arch'])
@@ -887,7 +1446,7 @@ def package(name, db):
                 pkg['srcurl_base'] = pkg['srcurl']
         if 'srcurl_base' in pkg and pkg['srcurl_base'].endswith('.git'):
             pkg['srcurl_base'] = pkg['srcurl_base'][:-4]
-    db.execute(SQL_ATTACH_PISS)
+    plugin.attach_lazy(db, 'piss')
     res_upstream = db.execute(SQL_GET_PISS_VERSION, (name,)).fetchone()
     if pkg['version'] and res_upstream and res_upstream['version']:
         pkg['upstream'] = dict(res_upstream)
@@ -898,7 +1457,8 @@ def package(name, db):
                 utils.version_compare(pkg['version'], res_upstream['version'])]
     return render('package.html', pkg=pkg)
 
-@app.route('/files/<reponame>/<branch>/<name>/<version>')
+@app.route('/files/<reponame>/<branch>/<name>/<version>',
+           skip=['respcache'])
 def files(name, version, reponame, branch, db):
     repo = reponame + '/' + branch
     res = db.execute(SQL_GET_PACKAGE_DEB_LOCAL, (name, version, repo)).fetchone()
@@ -928,7 +1488,7 @@ def files(name, version, reponame, branch, db):
     return render('files', alt=('html', 'tsv'), pkg=d, files=files,
         sodepends=sodepends, soprovides=soprovides)
 
-@app.route('/changelog/<name>')
+@app.route('/changelog/<name>', skip=['respcache'])
 def changelog(name, db):
     res = db.execute(SQL_GET_PACKAGE_INFO, (name,)).fetchone()
     if res is None:
@@ -944,7 +1504,7 @@ def changelog(name, db):
     bottle.response.content_type = 'text/plain; charset=UTF-8'
     return render('changelog.txt', name=name, changes=changelog)
 
-@app.route('/revdep/<name>')
+@app.route('/revdep/<name>', skip=['respcache'])
 def revdep(name, db):
     res = db.execute('SELECT 1 FROM packages WHERE name = ?', (name,)).fetchone()
     if res is None:
@@ -985,12 +1545,16 @@ def lagging(repo, db):
     if repo not in repos:
         return bottle.HTTPResponse(render('error', alt=('html', 'tsv'),
                 error='Repo "%s" not found.' % repo), 404)
-    packages = []
     arch = repos[repo]['architecture']
-    res = utils.Pager(db.execute(SQL_GET_PACKAGE_LAGGING,
-                (repo, arch)), pagesize, page)
-    for row in res:
-        packages.append(dict(row))
+    sql = (SQL_GET_PACKAGE_LAGGING_KEY if db_sortkeys(db)
+           else SQL_GET_PACKAGE_LAGGING)
+    pager = lambda db: db_pager(db, sql, (repo, arch), pagesize, page,
+                                'name', bottle.request.query.get('after'))
+    if stream_page_all():
+        return render_stream('lagging', pager,
+            error="There's no lagging packages.", repo=repo)
+    res = pager(db)
+    packages = list(map(dict, res))
     if packages:
         return render('lagging', alt=('html', 'tsv'),
             repo=repo, packages=packages, page=pagination(res))
@@ -1006,14 +1570,18 @@ def srcupd(tree, db):
         return bottle.HTTPResponse(render('error', alt=('html', 'tsv'),
                 error='Source tree "%s" not found.' % tree), 404)
     section = bottle.request.query.get('section') or None
-    packages = []
-    db.execute(SQL_ATTACH_PISS)
-    res = utils.Pager(db.execute(SQL_GET_PACKAGE_SRCUPD, (tree, section, section)), pagesize, page)
-    for row in res:
-        packages.append(dict(row))
+    def pager(db):
+        plugin.attach_lazy(db, 'piss')
+        return db_pager(db, SQL_GET_PACKAGE_SRCUPD, (tree, section, section),
+                        pagesize, page)
+    if stream_page_all():
+        return render_stream('srcupd', pager,
+            error="There's no outdated packages.", tree=tree, section=section)
+    res = pager(db)
+    packages = list(map(dict, res))
     if packages:
         return render('srcupd', alt=('html', 'tsv'),
-            tree=tree, packages=packages, section=section, page=pagination(res))
+            tree=tree, section=section, packages=packages, page=pagination(res))
     else:
         return render('error', alt=('html', 'tsv'),
             error="There's no outdated packages.")
@@ -1025,10 +1593,13 @@ def ghost(repo, db):
     if repo not in repos:
         return bottle.HTTPResponse(render('error.html',
                 error='Repo "%s" not found.' % repo), 404)
-    packages = []
-    res = utils.Pager(db.execute(SQL_GET_PACKAGE_GHOST, (repo,)), pagesize, page)
-    for row in res:
-        packages.append(dict(row))
+    pager = lambda db: db_pager(
+        db, SQL_GET_PACKAGE_GHOST, (repo,), pagesize, page)
+    if stream_page_all():
+        return render_stream('ghost', pager,
+            error="There's no ghost packages.", repo=repo)
+    res = pager(db)
+    packages = list(map(dict, res))
     if packages:
         return render('ghost', alt=('html', 'tsv'),
             repo=repo, packages=packages, page=pagination(res))
@@ -1043,13 +1614,16 @@ def missing(repo, db):
     if repo not in repos:
         return bottle.HTTPResponse(render('error.html',
                 error='Repo "%s" not found.' % repo), 404)
-    packages = []
     reponame = repos[repo]['realname']
     arch = repos[repo]['architecture']
-    res = utils.Pager(db.execute(SQL_GET_PACKAGE_MISSING,
-                (reponame, arch, reponame)), pagesize, page)
-    for row in res:
-        packages.append(dict(row))
+    pager = lambda db: db_pager(
+        db, SQL_GET_PACKAGE_MISSING, (reponame, arch, reponame),
+        pagesize, page, 'name', bottle.request.query.get('after'))
+    if stream_page_all():
+        return render_stream('missing', pager,
+            error="There's no missing packages.", repo=repo)
+    res = pager(db)
+    packages = list(map(dict, res))
     if packages:
         return render('missing', alt=('html', 'tsv'),
             repo=repo, packages=packages, page=pagination(res))
@@ -1064,32 +1638,95 @@ def tree(tree, db):
     if tree not in trees:
         return bottle.HTTPResponse(render('error', alt=('html', 'tsv'),
                 error='Source tree "%s" not found.' % tree), 404)
-    packages = []
-    res = utils.Pager(db.execute(SQL_GET_PACKAGE_TREE, (tree,)), pagesize, page)
-    for row in res:
+    def package(row):
         d = dict(row)
         d['dpkg_repos'] = ', '.join(sorted((d.pop('dpkg_availrepos') or '').split(',')))
         d['ver_compare'] = VER_REL[d['ver_compare']]
-        packages.append(d)
+        return d
+    pager = lambda db: db_pager(db, SQL_GET_PACKAGE_TREE, (tree,),
+        pagesize, page, 'name', bottle.request.query.get('after'))
+    if stream_page_all():
+        return render_stream('tree', pager, package,
+            error="There's no packages.", tree=tree)
+    res = pager(db)
+    packages = list(map(package, res))
     if packages:
         return render('tree', alt=('html', 'tsv'),
             tree=tree, packages=packages, page=pagination(res))
     else:
         return render('error', alt=('html', 'tsv'), error="There's no packages.")
 
-@app.route('/list.json')
-def pkg_list(db):
-    modified = db_last_modified(db)
+def stream_pkg_list(modified):
+    ''' Yields /list.json in chunks, one package at a time from the cursor.
+    The output is the same as json.dumps(..., sort_keys=True) of the whole
+    list. Uses its own connection, since the body is sent after the route
+    callback has returned its connection. '''
+    encode = json.JSONEncoder(sort_keys=True).encode
 
-    def _query():
-        packages = []
+    def parts(db):
+        yield '{"last_modified": %s, "packages": [' % encode(modified)
+        sep = ''
         for row in db.execute(SQL_GET_PACKAGE_LIST):
-            d = dict(row)
-            packages.append(d)
-        return json.dumps({'packages': packages, 'last_modified': modified},
-                          sort_keys=True)
+            yield sep + encode(dict(row))
+            sep = ', '
+        yield ']}'
 
-    return response_lm(_query, modified=modified,
+    with plugin.connection() as db:
+        yield from utils.iter_chunks(parts(db), STREAM_CHUNK_SIZE)
+
+def list_snapshot_version():
+    ''' The version of abbs.db that /list.json snapshots are made from. '''
+    return utils.file_version(DB_FILES[0])
+
+def pkg_list_snapshot(since=None):
+    ''' Serves /list.json from the files of listsnap.py, if they were made
+    from the current abbs.db. Returns None otherwise. With `since`, serves
+    the changes since that snapshot if they are known, or the full list. '''
+    try:
+        entry = cache_file_hash(CACHE_DIR, LIST_SNAPSHOT)
+    except OSError:
+        return None
+    if entry is None or entry[1] != list_snapshot_version():
+        return None
+    filename = os.path.join(CACHE_DIR, LIST_SNAPSHOT)
+    etag = '"%s"' % entry[1]
+    if since and RE_SNAPSHOT_KEY.match(since):
+        delta = os.path.join(CACHE_DIR, LIST_DELTA_DIR, since + '.json')
+        if os.path.isfile(delta):
+            filename = delta
+            etag = '"%s-since-%s"' % (entry[1], since)
+    encoding = utils.accept_encoding(
+        bottle.request.headers.get('Accept-Encoding'),
+        [coding for coding, ext in SNAPSHOT_CODINGS
+         if os.path.isfile(filename + ext)])
+    headers = {
+        'Vary': 'Accept-Encoding',
+        'Content-Type': 'application/json',
+    }
+    if encoding:
+        headers['Content-Encoding'] = encoding
+        etag = '%s-%s"' % (etag[:-1], encoding)
+        filename += dict(SNAPSHOT_CODINGS)[encoding]
+    try:
+        f = open(filename, 'rb')
+    except OSError:
+        return None
+    stat = os.fstat(f.fileno())
+    headers['Content-Length'] = stat.st_size
+    res = response_lm(lambda: f, headers=headers, modified=stat.st_mtime,
+                      etag=etag)
+    if res.body is not f:
+        f.close()
+    return res
+
+@app.route('/list.json', skip=['respcache'])
+def pkg_list():
+    res = pkg_list_snapshot(bottle.request.query.get('since'))
+    if res is not None:
+        return res
+    with plugin.connection() as db:
+        modified = db_last_modified(db)
+    return response_lm(lambda: stream_pkg_list(modified), modified=modified,
         headers={'Content-Type': 'application/json'})
 
 @app.route('/updates')
@@ -1111,14 +1748,18 @@ def repo(repo, db):
     if repo not in repos:
         return bottle.HTTPResponse(render('error.html',
                 error='Repo "%s" not found.' % repo), 404)
-    packages = []
-    res = utils.Pager(db.execute(SQL_GET_PACKAGE_REPO, (repo,)), pagesize, page)
-    for row in res:
+    def package(row):
         d = dict(row)
         latest, fullver = d['dpkg_version'], d['full_version']
         d['ver_compare'] = VER_REL[
-            utils.version_compare(latest, fullver) if latest else -1]
-        packages.append(d)
+            utils.version_compare(latest, fullver) if latest and fullver else -1]
+        return d
+    pager = lambda db: db_pager(db, SQL_GET_PACKAGE_REPO, (repo,),
+        pagesize, page, 'name', bottle.request.query.get('after'))
+    if stream_page_all():
+        return render_stream('repo', pager, package, repo=repo)
+    res = pager(db)
+    packages = list(map(package, res))
     return render('repo', alt=('html', 'tsv'),
         repo=repo, packages=packages, page=pagination(res))
 
@@ -1128,12 +1769,13 @@ def qa_index_redir():
     bottle.redirect('/qa/', 301)
 
 
-@app.route('/qa/')
+@app.route('/qa/', skip=['respcache'])
 def qa_index(db):
     tree_branches = {r[0]:r[1:] for r in
         db.execute("SELECT name, tree, branch FROM tree_branches")}
     repos = db_repos(db)
     olddebs = dict(db.execute("SELECT repo, oldcnt FROM dpkg_repo_stats"))
+    uninstallable = db_uninstallable_counts(db)
     numissues, issueratio, cnt_src, cnt_deb, recent = pg_issues()
     srclist = {repo: {r['errno']: (r['cnt'], r['ratio']) for r in group}
         for repo, group in
@@ -1157,6 +1799,7 @@ def qa_index(db):
         for row in debissues_matrix)
     return render('qa_index', alt=('html', 'tsv'), total=numissues,
                   percent=(100*issueratio), recent=recent, olddebs=olddebs,
+                  uninstallable=uninstallable,
                   srcissues_key=srcissues, debissues_key=debissues,
                   srcissues_matrix=srcissues_matrix,
                   debissues_matrix=debissues_matrix,
@@ -1170,8 +1813,8 @@ def qa_codedef():
         "https://wiki.aosc.io/developers/list-of-package-issue-codes", 303)
 
 
-@app.route('/qa/code/<code>')
-@app.route('/qa/code/<code>/<repo:path>')
+@app.route('/qa/code/<code>', skip=['respcache'])
+@app.route('/qa/code/<code>/<repo:path>', skip=['respcache'])
 def qa_code(db, code, repo=None):
     try:
         code = int(code)
@@ -1191,12 +1834,11 @@ def qa_code(db, code, repo=None):
     results = []
     with get_pgconn() as pgdb:
         cur = pgdb.cursor()
-        cur.execute(SQL_ISSUES_CODE, (code, repo))
-        res = utils.Pager(cur, pagesize, page)
+        res = pg_pager(cur, SQL_ISSUES_CODE, (code, repo), pagesize, page)
         results = []
         for row in res:
             d = dict(row)
-            d['versions'] = sorted(d['versions'], key=utils.version_compare_key)
+            d['versions'] = utils.sort_versions(d['versions'])
             results.append(d)
         page = pagination(res)
     return render('qa_code', alt=('html', 'tsv'),
@@ -1204,7 +1846,7 @@ def qa_code(db, code, repo=None):
                   packages=results, page=page)
 
 
-@app.route('/qa/packages/<name>')
+@app.route('/qa/packages/<name>', skip=['respcache'])
 def qa_package(name, db):
     name = name.strip()
     res = db.execute(SQL_GET_PACKAGE_INFO, (name,)).fetchone()
@@ -1254,6 +1896,25 @@ def qa_package(name, db):
     return render('qa_package.html', pkg=pkg, issues=issues)
 
 
+@app.route('/qa/uninstallable/<repo:path>')
+def qa_uninstallable(repo, db):
+    page, pagesize = get_page()
+    repos = db_repos(db)
+    if repo not in repos:
+        return bottle.HTTPResponse(render('error', alt=('html', 'tsv'),
+                error='Repo "%s" not found.' % repo), 404)
+    rows = db_uninstallable(db, repo)
+    res = utils.Pager(rows, pagesize, page)
+    packages = list(res)
+    if packages:
+        return render('qa_uninstallable', alt=('html', 'tsv'),
+            repo=repo, packages=packages, page=pagination(res),
+            pkgcount=len(set(row['name'] for row in rows)))
+    else:
+        return render('error', alt=('html', 'tsv'),
+            error="There's no uninstallable packages.")
+
+
 @app.route('/cleanmirror/<repo:path>')
 def cleanmirror(repo, db):
     reason = bottle.request.query.get('reason')
@@ -1275,7 +1936,17 @@ def cleanmirror(repo, db):
             debs.append(d)
     return render('cleanmirror', alt=('txt', 'tsv'), repo=repo, packages=debs)
 
-@app.route('/data/<filename>')
+def cache_file_hash(cachedir, filename):
+    ''' Returns the size and hash of `filename` in the dbhashs file of
+    `cachedir`, or None if it is not listed. '''
+    with open(os.path.join(cachedir, 'dbhashs'), 'r', encoding='utf-8') as f:
+        for ln in f:
+            fsize, fhash, fname = ln.strip().split(' ', 2)
+            if fname == filename:
+                return fsize, fhash
+    return None
+
+@app.route('/data/<filename>', skip=['respcache'])
 def data_dl(db, filename):
     attachfn = filename
     if filename.endswith('.db'):
@@ -1285,15 +1956,11 @@ def data_dl(db, filename):
         filename = filename[:-3]
     else:
         bottle.abort(404, "Not found: '/data/%s'" % filename)
-    cachedir = 'data/cache'
-    fsize = fhash = None
-    with open(os.path.join(cachedir, 'dbhashs'), 'r', encoding='utf-8') as f:
-        for ln in f:
-            fsize, fhash, fname = ln.strip().split(' ', 2)
-            if fname == filename:
-                break
-        else:
-            bottle.abort(404, "Not found: '/data/%s'" % filename)
+    cachedir = CACHE_DIR
+    entry = cache_file_hash(cachedir, filename)
+    if entry is None:
+        bottle.abort(404, "Not found: '/data/%s'" % filename)
+    fsize, fhash = entry
     gzfile = os.path.join(cachedir, filename + '.gz')
     accept_encoding = bottle.request.headers.get('Accept-Encoding', '')
     headers = {
@@ -1322,6 +1989,30 @@ def data_dl(db, filename):
 def api_version(db):
     return {"version": __version__}
 
+@app.route('/api/complete')
+def api_complete(db):
+    q = bottle.request.query.get('q', '').strip().lower()
+    try:
+        limit = max(1, min(int(bottle.request.query.get('limit')),
+                           COMPLETE_MAX_LIMIT))
+    except (TypeError, ValueError):
+        limit = COMPLETE_LIMIT
+    names, times = db_names(db)
+    lo = bisect.bisect_left(names, q)
+    # names are ASCII
+    hi = bisect.bisect_left(names, q + '\x7f', lo)
+    if bottle.request.query.get('sort') == 'time':
+        found = heapq.nlargest(limit, range(lo, hi), key=times.__getitem__)
+    else:
+        found = range(lo, min(hi, lo + limit))
+    bottle.response.set_header('Cache-Control', 'public, max-age=3600')
+    return {"q": q, "packages": [names[i] for i in found],
+            "count": hi - lo}
+
+@app.route('/api/stats')
+def api_stats():
+    return {"pgpool": pgpool.stats(), "respcache": respcache.cache.stats()}
+
 @app.route('/')
 def index(db):
     source_trees = list(db_trees(db).values())
@@ -210,52 +210,87 @@ var autoComplete = (function(){
   }
   return autoComplete;
 })();
-function trieitems(trie, prefix) {
-  var items = [];
-  if (trie === 0) {
-    return items;
-  }
-  for (var key in trie) {
-    if (key !== '$') {
-      if (trie[key] !== 0) {
-        items = items.concat(trieitems(trie[key], prefix + key))
-      } else {
-        items.push(prefix + key)
+// pkgTrie is a packed automaton of package names, see dafsa.py
+// a node is [final, [[label, target], ...]], target is null for the end
+function unpackTrie(packed) {
+  var shared = [], pos = 0;
+  function read(node) {
+    if (packed.charAt(pos) === '!') {
+      node[0] = true;
+      pos++;
+    }
+    while (pos < packed.length && '}]'.indexOf(packed.charAt(pos)) < 0) {
+      if (packed.charAt(pos) === ',') pos++;
+      var start = pos;
+      while (pos < packed.length && ',{}[]:'.indexOf(packed.charAt(pos)) < 0) pos++;
+      var label = packed.substring(start, pos), c = packed.charAt(pos), target = null;
+      if (c === ':') {
+        start = ++pos;
+        while (pos < packed.length && ',}]'.indexOf(packed.charAt(pos)) < 0) pos++;
+        target = shared[parseInt(packed.substring(start, pos), 36)];
+      } else if (c === '{' || c === '[') {
+        target = [false, []];
+        if (c === '[') shared.push(target);
+        pos++;
+        read(target);
+        pos++;
       }
-    } else {
-      items.push(prefix)
+      node[1].push([label, target]);
     }
+    return node;
+  }
+  return read([false, []]);
+}
+function trieitems(node, prefix, items) {
+  if (node === null) {
+    items.push(prefix);
+    return items;
+  }
+  if (node[0]) items.push(prefix);
+  for (var i = 0; i < node[1].length; i++) {
+    trieitems(node[1][i][1], prefix + node[1][i][0], items);
   }
   return items;
 }
 function prefixSearch(trie, term){
   term = term.toLowerCase();
-  var matches = [];
-  var subtrie = trie;
-  var found = true;
-  for (i=0; i<term.length; i++) {
-    subtrie = subtrie[term.charAt(i)];
-    if (subtrie === undefined) {
-      found = false;
-      break;
-    } else if (subtrie === 0) {
-      matches.push(term.substring(0, i+1));
-      found = false;
-      break;
+  var node = trie, pos = 0;
+  while (pos < term.length) {
+    if (node === null) return [term.substring(0, pos)];
+    var edge = null;
+    for (var i = 0; i < node[1].length; i++) {
+      if (node[1][i][0].charAt(0) === term.charAt(pos)) {
+        edge = node[1][i];
+        break;
+      }
     }
+    if (edge === null) return [];
+    var label = edge[0];
+    if (label.substring(0, term.length - pos) !== term.substring(pos, pos + label.length)) return [];
+    node = edge[1];
+    if (pos + label.length > term.length) {
+      return trieitems(node, term.substring(0, pos) + label, []);
+    }
+    pos += label.length;
   }
-  if (found) {
-    matches = trieitems(subtrie, term);
-  }
-  matches.sort();
-  // console.log(term, matches);
-  return matches;
+  return trieitems(node, term, []);
 }
 document.addEventListener("DOMContentLoaded", function(event) {
   var pkgComplete = new autoComplete({
     selector: 'input#searchinput',
     minChars: 2,
     source: function(term, suggest){
+      if (typeof pkgTrie === 'undefined') {
+        // without /pkgtrie.js, ask the server
+        var xhr = new XMLHttpRequest();
+        xhr.open('GET', '/api/complete?limit=100&q=' + encodeURIComponent(term));
+        xhr.onload = function() {
+          suggest(xhr.status === 200 ? JSON.parse(xhr.responseText).packages : []);
+        };
+        xhr.send();
+        return;
+      }
+      if (typeof pkgTrie === 'string') pkgTrie = unpackTrie(pkgTrie);
       suggest(prefixSearch(pkgTrie, term));
     },
     renderItem: function (item, search){
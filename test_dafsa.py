@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import random
+import unittest
+
+import dafsa
+
+ALPHABET = 'abcxyz0129+-.'
+
+
+def random_words(rnd, count):
+    words = set()
+    for i in range(count):
+        words.add(''.join(rnd.choice(ALPHABET)
+                          for j in range(rnd.randint(1, 12))))
+    return words
+
+
+class TestDafsa(unittest.TestCase):
+
+    def test_words(self):
+        rnd = random.Random(0)
+        for count in (0, 1, 2, 10, 100, 2000):
+            words = random_words(rnd, count)
+            with self.subTest(count=count):
+                packed = dafsa.pack(words)
+                self.assertEqual(dafsa.words(packed), sorted(words))
+        self.assertEqual(dafsa.words(dafsa.pack(['', 'a'])), ['', 'a'])
+        self.assertEqual(dafsa.pack(['ab', 'cb', 'abc']), 'ab{!c},cb')
+        self.assertEqual(dafsa.pack(['ax', 'ay', 'bx', 'by']), 'a[x,y],b:0')
+
+    def test_minimal(self):
+        # suffixes are shared
+        words = ['%s-%s' % (a, b) for a in ('foo', 'bar', 'baz')
+                 for b in ('dev', 'doc', 'utils')]
+        packed = dafsa.pack(words)
+        self.assertEqual(packed.count('utils'), 1)
+        self.assertEqual(dafsa.words(packed), sorted(words))
+
+    def test_complete(self):
+        rnd = random.Random(1)
+        words = sorted(random_words(rnd, 2000))
+        root = dafsa.unpack(dafsa.pack(words))
+        terms = ['', 'a', 'zzzzzzzzzzzzz'] + [
+            w[:rnd.randint(0, len(w))] + rnd.choice(('', '', 'a', '+'))
+            for w in rnd.sample(words, 500)]
+        for term in terms:
+            expected = [w for w in words if w.startswith(term)]
+            if not expected:
+                # past the end of a word that is not a prefix of another one
+                leaves = [w for w in words if term.startswith(w) and
+                          not any(x.startswith(w) and x != w for x in words)]
+                expected = leaves[-1:]
+            with self.subTest(term=term):
+                self.assertEqual(dafsa.complete(root, term), expected)
+
+    def test_invalid(self):
+        for word in ('a,b', 'a!', 'a[', 'b}', 'c:1'):
+            with self.subTest(word=word):
+                self.assertRaises(ValueError, dafsa.pack, ['a', word])
+
+if __name__ == '__main__':
+    unittest.main()
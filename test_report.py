@@ -2,6 +2,7 @@
 # -*- coding: utf-8 -*-
 
 import os
+import math
 import random
 import shutil
 import sqlite3
@@ -105,18 +106,161 @@ class TestWebsite(unittest.TestCase):
         req.close()
         self.assertEqual(len(d_json['packages']), d_index['total'])
 
+    def test_listjson_encoding(self):
+        url = URLBASE + '/list.json'
+        req = requests.get(url, headers={"Accept-Encoding": "identity"})
+        req.raise_for_status()
+        d_json = req.json()
+        req.close()
+        req = requests.get(url, headers={"Accept-Encoding": "gzip"})
+        req.raise_for_status()
+        self.assertEqual(req.json(), d_json)
+        etag = req.headers.get('ETag')
+        req.close()
+        if etag:
+            # served from a listsnap.py snapshot
+            req = requests.get(url, headers={
+                "Accept-Encoding": "gzip", "If-None-Match": etag})
+            self.assertEqual(req.status_code, 304)
+            req.close()
+
+    def test_listjson_since(self):
+        url = URLBASE + '/list.json'
+        req = requests.get(url)
+        req.raise_for_status()
+        d_json = req.json()
+        req.close()
+        req = requests.get(url, params={'since': d_json['last_modified']})
+        req.raise_for_status()
+        d_delta = req.json()
+        req.close()
+        self.assertEqual(d_delta['last_modified'], d_json['last_modified'])
+        if 'since' in d_delta:
+            # no changes since the current snapshot
+            self.assertEqual(d_delta['packages'], [])
+            self.assertEqual(d_delta['removed'], [])
+        else:
+            self.assertEqual(d_delta, d_json)
+        req = requests.get(url, params={'since': 'nonexistent'})
+        self.assertEqual(req.json(), d_json)
+        req.close()
+
     def test_pkgtrie(self):
         url = URLBASE + '/pkgtrie.js'
         req = requests.get(url)
         req.raise_for_status()
         lm = req.headers['Last-Modified']
-        self.assertTrue(req.text.startswith('var pkgTrie = {'))
+        self.assertTrue(req.text.startswith('var pkgTrie = "'))
         req.close()
         req = requests.get(url, headers={"If-Modified-Since": lm})
         self.assertEqual(req.status_code, 304)
         self.assertEqual(req.content, b'')
         req.close()
 
+    def test_pkgtrie_encoding(self):
+        url = URLBASE + '/pkgtrie.js'
+        req = requests.get(url, headers={"Accept-Encoding": "identity"})
+        req.raise_for_status()
+        body = req.content
+        etag = req.headers['ETag']
+        self.assertNotIn('Content-Encoding', req.headers)
+        self.assertIn('max-age', req.headers['Cache-Control'])
+        req.close()
+        req = requests.get(url, headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(req.headers['Content-Encoding'], 'gzip')
+        self.assertNotEqual(req.headers['ETag'], etag)
+        self.assertEqual(req.content, body)
+        req.close()
+        req = requests.get(url + '?v=1', headers={
+            "Accept-Encoding": "identity", "If-None-Match": etag})
+        self.assertEqual(req.status_code, 304)
+        self.assertIn('immutable', req.headers['Cache-Control'])
+        req.close()
+
+    def test_complete(self):
+        url = URLBASE + '/api/complete'
+        req = requests.get(url, params={'q': 'GLIB'})
+        req.raise_for_status()
+        d = req.json()
+        req.close()
+        self.assertIn('glibc', d['packages'])
+        self.assertEqual(d['packages'], sorted(d['packages']))
+        self.assertTrue(all(name.startswith('glib') for name in d['packages']))
+        self.assertGreaterEqual(d['count'], len(d['packages']))
+        req = requests.get(url, params={'q': 'lib', 'limit': 5, 'sort': 'time'})
+        req.raise_for_status()
+        d = req.json()
+        req.close()
+        self.assertEqual(len(d['packages']), 5)
+        req = requests.get(url, params={'q': 'glibc', 'limit': 1},
+                           headers={'Accept': 'application/json'})
+        self.assertEqual(req.json()['packages'], ['glibc'])
+        self.assertIn('max-age', req.headers['Cache-Control'])
+        req.close()
+
+    def test_keyset(self):
+        url = URLBASE + '/repo/amd64/stable?type=json'
+        req = requests.get(url + '&page=all')
+        req.raise_for_status()
+        allnames = [p['name'] for p in req.json()['packages']]
+        req.close()
+        names = []
+        after = ''
+        while after is not None:
+            req = requests.get(url, params={'after': after})
+            req.raise_for_status()
+            d = req.json()
+            req.close()
+            names.extend(p['name'] for p in d['packages'])
+            after = d['page']['next']
+        self.assertListEqual(names, allnames)
+        # the next link keeps the other query parameters
+        req = requests.get(URLBASE + '/tree/aosc-os-abbs',
+                           params={'type': 'html', 'after': allnames[0]})
+        req.raise_for_status()
+        self.assertIn('href="?type=html&amp;after=', req.text)
+        req.close()
+
+    def test_page_all_stream(self):
+        for path in ('/repo/amd64/stable', '/tree/aosc-os-abbs',
+                     '/srcupd/aosc-os-abbs'):
+            with self.subTest(path=path):
+                req = requests.get(URLBASE + path + '?type=json&page=all')
+                req.raise_for_status()
+                d = req.json()
+                req.close()
+                self.assertEqual(d['page']['count'], len(d['packages']))
+                self.assertEqual(d['page']['max'], 1 if d['packages'] else 0)
+                req = requests.get(URLBASE + path + '?type=tsv&page=all')
+                req.raise_for_status()
+                self.assertEqual(req.headers['Content-Type'],
+                                 'text/plain; charset=UTF-8')
+                lines = req.text.splitlines()
+                req.close()
+                self.assertEqual(len(lines), len(d['packages']) + 1)
+                self.assertListEqual([ln.split('\t')[0] for ln in lines[1:]],
+                                     [p['name'] for p in d['packages']])
+
+    def test_etag(self):
+        for path in ('/', '/packages/glibc', '/repo/amd64/stable?type=tsv'):
+            with self.subTest(path=path):
+                req = requests.get(URLBASE + path)
+                req.raise_for_status()
+                etag = req.headers['ETag']
+                req.close()
+                req = requests.get(URLBASE + path,
+                                   headers={'If-None-Match': etag})
+                self.assertEqual(req.status_code, 304)
+                self.assertEqual(req.content, b'')
+                self.assertEqual(req.headers['ETag'], etag)
+                req.close()
+                req = requests.get(URLBASE + path, headers={
+                    'If-None-Match': etag,
+                    'X-Requested-With': 'XMLHttpRequest'})
+                self.assertEqual(req.status_code, 200)
+                self.assertNotEqual(req.headers['ETag'], etag)
+                req.close()
+
     def test_static(self):
         for filename in ('aosc.png', 'style.css', 'autocomplete.js'):
             req = requests.get(URLBASE + '/static/' + filename)
@@ -138,6 +282,23 @@ class TestWebsite(unittest.TestCase):
             URLBASE + '/search/?q=glib&noredir=1&type={vtype}', ('html', 'tsv'))
         self.assertTrue(d['packages'])
 
+    def test_search_pages(self):
+        url = URLBASE + '/search/?q=lib&type=json&page='
+        req = requests.get(url + 'all')
+        req.raise_for_status()
+        d_all = req.json()
+        req.close()
+        names = []
+        pagecount = math.ceil(d_all['page']['count'] / 60)
+        for page in range(1, pagecount + 2):
+            req = requests.get(url + str(page))
+            req.raise_for_status()
+            d = req.json()
+            req.close()
+            self.assertEqual(d['page']['count'], d_all['page']['count'])
+            names.extend(pkg['name'] for pkg in d['packages'])
+        self.assertListEqual(names, [pkg['name'] for pkg in d_all['packages']])
+
     def test_query(self):
         req = requests.get(URLBASE + '/query/')
         self.assertEqual(req.status_code, 200)
@@ -189,6 +350,25 @@ class TestWebsite(unittest.TestCase):
                             URLBASE, dpkg['repo'], d['pkg']['name'],
                             urllib.parse.quote(dpkg['version'])), ('html', 'tsv'))
 
+    def test_package_notfound(self):
+        req = requests.get(URLBASE + '/packages/no-such-package-x')
+        self.assertEqual(req.status_code, 404)
+        req.close()
+        req = requests.get(URLBASE + '/search/?q=no-such-package-x')
+        self.assertEqual(req.status_code, 200)
+        self.assertFalse(req.history)
+        req.close()
+
+    def test_suggestions(self):
+        req = requests.get(URLBASE + '/packages/glibx?type=json')
+        self.assertEqual(req.status_code, 404)
+        self.assertIn('glibc', req.json()['suggestions'])
+        req = requests.get(URLBASE + '/search/?q=glibx&type=json')
+        self.assertEqual(req.status_code, 200)
+        self.assertIn('glibc', req.json()['suggestions'])
+        req = requests.get(URLBASE + '/packages/no-such-package-x?type=json')
+        self.assertEqual(req.json()['suggestions'], [])
+
     def test_changelog(self):
         req = requests.get(URLBASE + '/changelog/glibc')
         self.assertEqual(req.status_code, 200)
@@ -208,6 +388,25 @@ class TestWebsite(unittest.TestCase):
             self.assertEqual(req.status_code, 200)
             self.assertEqual(req.headers['content-type'].lower(), 'text/plain; charset=utf-8')
 
+    def test_uninstallable(self):
+        dindex = self._test_view_type(URLBASE + '/?type={vtype}')
+        for _, cat in dindex['repo_categories']:
+            for row in cat:
+                with self.subTest(repo=row['name']):
+                    d = self._test_view_type(
+                        URLBASE + '/qa/uninstallable/%s?type={vtype}&page=all'
+                        % row['name'], ('html', 'tsv'))
+                    if 'error' in d:
+                        continue
+                    self.assertEqual(d['page']['count'], len(d['packages']))
+                    self.assertEqual(d['pkgcount'], len(
+                        set(pkg['name'] for pkg in d['packages'])))
+                    for pkg in d['packages']:
+                        self.assertTrue(pkg['dependency'])
+        req = requests.get(URLBASE + '/qa/uninstallable/nonexistent/repo')
+        self.assertEqual(req.status_code, 404)
+        req.close()
+
     def test_dbdownload(self):
         with tempfile.TemporaryDirectory() as tmpdir:
             for name in (
@@ -307,6 +506,21 @@ class TestWebsite(unittest.TestCase):
                 self.validate_tsv(text, rowcount)
         return d
 
+    def test_pgpool(self):
+        req = requests.get(URLBASE + '/api/stats')
+        req.raise_for_status()
+        before = req.json()['pgpool']
+        req.close()
+        for _ in range(3):
+            req = requests.get(URLBASE + '/revdep/glibc')
+            self.assertEqual(req.status_code, 200)
+            req.close()
+        req = requests.get(URLBASE + '/api/stats')
+        after = req.json()['pgpool']
+        req.close()
+        self.assertGreaterEqual(after['checkouts'], before.get('checkouts', 0) + 3)
+        self.assertLessEqual(after['size'], after['maxsize'])
+
     def test_api_version(self):
         req = requests.get(URLBASE + '/api_version')
         req.raise_for_status()
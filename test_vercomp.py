@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import random
+import sqlite3
+import unittest
+import functools
+import itertools
+
+import utils
+import debian_support
+
+MOD_VERCOMP = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mod_vercomp')
+
+SPECIAL_VERSIONS = (
+    '0', '00', '0.0', '0~', '0~~', '0~a', '0a', '0+', '0.', '0-0', '0-00',
+    '1', '1.0', '1.00', '1.0-0', '1.0-1', '1.0-1~', '1.0~rc1', '1.0~rc1-1',
+    '1.0+git20230101', '1.0.0', '1.0a', '1.0A', '1.0z', '1.0.', '1.0+', '1.0~',
+    '1:0', '1:1.0', '2:0.1', '10:1', '01:2', '1:1.0-1-2', '1.0-1-2',
+    '1.2.3-4.5+b1', '2.30-0ubuntu1', '9999', '10000', '099', '99',
+    '3.0~~beta', '3.0~beta', '3.0~beta1', '3.0~beta10', '3.0~beta2',
+    '1:2:3', '1:2:3-4', 'a', 'A', 'z', 'Z', 'a1', 'aa', 'a~', 'a+',
+)
+
+
+def random_version(rnd):
+    def part(alphabet, maxlen):
+        return ''.join(rnd.choice(alphabet) for i in range(rnd.randint(1, maxlen)))
+    pieces = []
+    for i in range(rnd.randint(1, 5)):
+        if rnd.random() < 0.7:
+            pieces.append(str(rnd.choice((0, 1, 2, 9, 10, 11, 99, 100, 2023))
+                              ).zfill(rnd.choice((0, 0, 0, 2, 3))))
+        else:
+            pieces.append(part('abzABZ', 3))
+        pieces.append(rnd.choice(('.', '.', '+', '~', '')))
+    upstream = ''.join(pieces)
+    if not upstream[0].isdigit():
+        upstream = str(rnd.randint(0, 9)) + upstream
+    version = upstream
+    if rnd.random() < 0.2:
+        version = '%d:%s' % (rnd.choice((0, 1, 2, 10)), version)
+    if rnd.random() < 0.5:
+        version += '-' + part('0123456789.+~ab', 4)
+    return version
+
+
+def sign(x):
+    return (x > 0) - (x < 0)
+
+
+class TestVercomp(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.db = sqlite3.connect(':memory:')
+        cls.db.enable_load_extension(True)
+        cls.db.load_extension(MOD_VERCOMP)
+        cls.db.enable_load_extension(False)
+        rnd = random.Random(20231001)
+        versions = set(SPECIAL_VERSIONS)
+        while len(versions) < 5000:
+            versions.add(random_version(rnd))
+        cls.versions = sorted(versions)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.db.close()
+
+    def expected(self, a, b):
+        # dpkg-equal versions are ordered bytewise by the collation
+        return debian_support.version_compare(a, b) or sign((a > b) - (a < b))
+
+    def test_collation_pairs(self):
+        rnd = random.Random(1)
+        pairs = list(itertools.combinations(SPECIAL_VERSIONS, 2))
+        pairs.extend(
+            (rnd.choice(self.versions), rnd.choice(self.versions))
+            for i in range(50000))
+        self.db.execute('CREATE TEMP TABLE pairs (a TEXT, b TEXT)')
+        self.db.executemany('INSERT INTO pairs VALUES (?, ?)', pairs)
+        result = self.db.execute(
+            "SELECT a, b, (a > b COLLATE vercomp) - (a < b COLLATE vercomp) "
+            "FROM pairs").fetchall()
+        self.db.execute('DROP TABLE pairs')
+        for a, b, cmp in result:
+            self.assertEqual(cmp, self.expected(a, b), (a, b))
+
+    def test_collation_order(self):
+        self.db.execute('CREATE TEMP TABLE versions (v TEXT)')
+        self.db.executemany('INSERT INTO versions VALUES (?)',
+                            ((v,) for v in self.versions))
+        result = [row[0] for row in self.db.execute(
+            'SELECT v FROM versions ORDER BY v COLLATE vercomp')]
+        maxver = self.db.execute(
+            'SELECT max(v COLLATE vercomp) FROM versions').fetchone()[0]
+        self.db.execute('DROP TABLE versions')
+        expected = sorted(self.versions, key=functools.cmp_to_key(self.expected))
+        self.assertEqual(result, expected)
+        self.assertEqual(maxver, expected[-1])
+
+    def test_aggregates(self):
+        rnd = random.Random(3)
+        rows = [(rnd.randrange(200), rnd.choice(self.versions), i)
+                for i in range(20000)]
+        rows.extend((200, None, i) for i in range(3))
+        self.db.execute('CREATE TEMP TABLE agg (grp INTEGER, v TEXT, i INTEGER)')
+        self.db.executemany('INSERT INTO agg VALUES (?, ?, ?)', rows)
+        result = self.db.execute(
+            'SELECT grp, max_vercomp(v), min_vercomp(v), '
+            'max(v COLLATE vercomp), min(v COLLATE vercomp), '
+            'argmax_vercomp(v, i), argmin_vercomp(v, i) '
+            'FROM agg GROUP BY grp ORDER BY grp').fetchall()
+        empty = self.db.execute(
+            'SELECT max_vercomp(v), argmin_vercomp(v, i) FROM agg WHERE 0'
+            ).fetchone()
+        self.db.execute('DROP TABLE agg')
+        key = functools.cmp_to_key(self.expected)
+        for grp, vmax, vmin, cmax, cmin, imax, imin in result:
+            if grp == 200:
+                self.assertEqual((vmax, vmin, imax, imin), (None,) * 4)
+                continue
+            group = [row for row in rows if row[0] == grp]
+            self.assertEqual(vmax, max((row[1] for row in group), key=key))
+            self.assertEqual(vmin, min((row[1] for row in group), key=key))
+            self.assertEqual((vmax, vmin), (cmax, cmin))
+            # the first row holding the extreme version wins
+            self.assertEqual(imax, min(row[2] for row in group if row[1] == vmax))
+            self.assertEqual(imin, min(row[2] for row in group if row[1] == vmin))
+        self.assertEqual(empty, (None, None))
+
+    def test_sortkey(self):
+        versions = self.versions + [
+            '', '-', ':', '1.0-', '-1:2', ' 3:1', '1:' + '9' * 300, '9' * 300,
+            '99999999999999999999:1', '1.0\u00e9', '\u00e91']
+        keys = dict(self.db.execute(
+            'SELECT column1, dpkg_sortkey(column1) FROM (VALUES %s)'
+            % ','.join(['(?)'] * len(versions)), versions).fetchall())
+        for version in versions:
+            self.assertEqual(keys[version], utils._py_dpkg_sortkey(version), version)
+            self.assertEqual(keys[version], utils.dpkg_sortkey(version), version)
+        self.assertIsNone(self.db.execute(
+            'SELECT dpkg_sortkey(NULL)').fetchone()[0])
+        rnd = random.Random(4)
+        for i in range(20000):
+            a, b = rnd.choice(versions), rnd.choice(versions)
+            cmp = self.db.execute(
+                'SELECT (? > ? COLLATE vercomp) - (? < ? COLLATE vercomp)',
+                (a, b, a, b)).fetchone()[0]
+            self.assertEqual(sign((keys[a] > keys[b]) - (keys[a] < keys[b])),
+                             cmp, (a, b))
+
+    def test_utils(self):
+        rnd = random.Random(5)
+        for i in range(20000):
+            a, b = rnd.choice(self.versions), rnd.choice(self.versions)
+            self.assertEqual(utils.version_compare(a, b), self.expected(a, b), (a, b))
+            self.assertEqual(utils._py_version_compare(a, b), self.expected(a, b), (a, b))
+        expected = sorted(self.versions, key=functools.cmp_to_key(self.expected))
+        shuffled = list(self.versions)
+        rnd.shuffle(shuffled)
+        self.assertEqual(utils.sort_versions(shuffled), expected)
+        self.assertEqual(utils.sort_versions(iter(shuffled), reverse=True),
+                         expected[::-1])
+
+    def test_fuzz(self):
+        # mutated versions, most of them invalid: every implementation of
+        # the C algorithm must agree, debian_support wherever dpkg would
+        rnd = random.Random(6)
+        def mutate(version):
+            chars = list(version)
+            for i in range(rnd.randint(1, 3)):
+                pos = rnd.randint(0, len(chars))
+                if rnd.random() < 0.5 or not chars:
+                    chars.insert(pos, rnd.choice('0129.+-:~azAZ_ \u00e9'))
+                else:
+                    del chars[min(pos, len(chars) - 1)]
+            return ''.join(chars)
+        def dpkg_valid(version):
+            try:
+                ver = debian_support.Version(version)
+            except ValueError:
+                return False
+            return (ver.debian_revision is not None
+                    or '-' not in ver.upstream_version)
+        for i in range(20000):
+            a = mutate(rnd.choice(self.versions))
+            b = mutate(a) if i % 2 else rnd.choice(self.versions)
+            cmp = self.db.execute(
+                'SELECT (?1 > ?2 COLLATE vercomp) - (?1 < ?2 COLLATE vercomp)',
+                (a, b)).fetchone()[0]
+            self.assertEqual(utils.version_compare(a, b) if utils._vercomp
+                             else cmp, cmp, (a, b))
+            self.assertEqual(utils._py_version_compare(a, b), cmp, (a, b))
+            self.assertEqual(utils.cmp(utils._py_dpkg_sortkey(a),
+                                       utils._py_dpkg_sortkey(b)), cmp, (a, b))
+            self.assertEqual(utils.cmp(utils.dpkg_sortkey(a),
+                                       utils.dpkg_sortkey(b)), cmp, (a, b))
+            if dpkg_valid(a) and dpkg_valid(b):
+                self.assertEqual(self.expected(a, b), cmp, (a, b))
+
+    def test_edit_distance(self):
+        def levenshtein(a, b):
+            row = list(range(len(b) + 1))
+            for i, ca in enumerate(a, 1):
+                diag, row[0] = row[0], i
+                for j, cb in enumerate(b, 1):
+                    diag, row[j] = row[j], min(
+                        row[j] + 1, row[j-1] + 1, diag + (ca != cb))
+            return row[-1]
+        self.assertEqual(utils._py_edit_distance('kitten', 'sitting'), 3)
+        self.assertEqual(utils.edit_distance('', 'abc'), 3)
+        rnd = random.Random(7)
+        words = [''.join(rnd.choice('abc-+\u00e9\U0001f600')
+                         for j in range(rnd.randint(0, 8)))
+                 for i in range(500)] + ['a' * 300, 'a' * 150 + 'b' * 150]
+        for i in range(20000):
+            a, b = rnd.choice(words), rnd.choice(words)
+            expected = levenshtein(a, b)
+            self.assertEqual(utils.edit_distance(a, b), expected, (a, b))
+            self.assertEqual(utils._py_edit_distance(a, b), expected, (a, b))
+        index = utils.SegmentIndex(words)
+        for word in rnd.sample(words, 50) + ['', 'zzz', 'a' * 299]:
+            for maxdist in (0, 1, 2):
+                expected = sorted({(utils.edit_distance(word, x), x)
+                                   for x in words})
+                expected = [x for x in expected if x[0] <= maxdist]
+                self.assertEqual(index.search(word, maxdist), expected)
+                self.assertEqual(index.search(word, maxdist, 3), expected[:3])
+
+    def test_compare_dpkgrel(self):
+        ops = {
+            '<<': lambda c: c < 0, '<': lambda c: c < 0,
+            '<=': lambda c: c <= 0, '=': lambda c: c == 0,
+            '==': lambda c: c == 0, '>=': lambda c: c >= 0,
+            '>>': lambda c: c > 0, '>': lambda c: c > 0,
+            '': lambda c: True,
+        }
+        rnd = random.Random(2)
+        for i in range(5000):
+            a, b = rnd.choice(self.versions), rnd.choice(self.versions)
+            if i % 10 == 0:
+                b = a
+            cmp = self.expected(a, b)
+            for op, check in ops.items():
+                self.assertEqual(self.db.execute(
+                    'SELECT compare_dpkgrel(?, ?, ?)', (a, op, b)).fetchone()[0],
+                    int(check(cmp)), (a, op, b))
+        self.assertIsNone(self.db.execute(
+            "SELECT compare_dpkgrel('1', '<>', '2')").fetchone()[0])
+        self.assertEqual(self.db.execute(
+            "SELECT compare_dpkgrel('1', NULL, '2')").fetchone()[0], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,24 +5,121 @@ import os
 import re
 import math
 import time
+import hashlib
+import inspect
 import weakref
+import traceback
 import itertools
 import functools
+import threading
+import contextlib
 import collections
 import collections.abc
-from debian_support import version_compare as _version_compare
+
+try:
+    import _vercomp
+except ImportError:
+    _vercomp = None
 
 cmp = lambda a, b: ((a > b) - (a < b))
 
+_re_sortkey_epoch = re.compile(rb'[ \t\n\v\f\r]*([+-]?[0-9]+)')
+_re_sortkey_pair = re.compile(rb'([^0-9]*)0*([0-9]*)')
+_sortkey_chars = tuple(
+    b'\x01' if c == 0x7e else
+    bytes((c,)) if 0x41 <= c <= 0x5a or 0x61 <= c <= 0x7a else
+    bytes((0xfe, c)) for c in range(256))
+
+def _py_dpkg_sortkey(version):
+    """
+    Byte string that sorts like `version` under the vercomp collation.
+    Same as the dpkg_sortkey() SQL function, see vercomp.h for the format.
+    """
+    raw = version.encode('utf-8') if isinstance(version, str) else version
+    epoch = 0
+    ver = raw
+    colon = raw.find(b':')
+    if colon != -1:
+        match = _re_sortkey_epoch.match(raw)
+        if match:
+            epoch = min(max(int(match.group(1)), -2**63), 2**63 - 1)
+        ver = raw[colon+1:]
+    upstream, hyphen, revision = ver.rpartition(b'-')
+    if not hyphen:
+        upstream, revision = revision, b'0'
+    key = bytearray((epoch + 2**63).to_bytes(8, 'big'))
+    for part in (upstream, revision):
+        pos = 0
+        while True:
+            match = _re_sortkey_pair.match(part, pos)
+            run, digits = match.groups()
+            key += b''.join(_sortkey_chars[c] for c in run)
+            key.append(2)
+            if len(digits) < 0xff:
+                key.append(len(digits))
+            else:
+                key += b'\xff' + len(digits).to_bytes(4, 'big')
+            key += digits
+            pos = match.end()
+            if pos >= len(part):
+                break
+        key.append(3)
+    key += raw
+    return bytes(key)
+
 @functools.lru_cache(maxsize=1024)
-def version_compare(a, b):
-    try:
-        return _version_compare(a, b) or cmp(a, b)
-    except ValueError:
-        return cmp(a, b)
+def _py_version_compare(a, b):
+    # by the sort keys, so that invalid versions are ordered like in SQL
+    return cmp(_py_dpkg_sortkey(a), _py_dpkg_sortkey(b))
+
+def _py_edit_distance(a, b):
+    ''' Levenshtein distance of two strings, computed a column at a time
+    with bit vectors (Myers, 1999). '''
+    if len(a) < len(b):
+        a, b = b, a
+    if not b:
+        return len(a)
+    peq = {}
+    for i, c in enumerate(b):
+        peq[c] = peq.get(c, 0) | (1 << i)
+    mask = (1 << len(b)) - 1
+    last = 1 << (len(b) - 1)
+    pv = mask
+    mv = 0
+    score = len(b)
+    for c in a:
+        eq = peq.get(c, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | ~(xh | pv)
+        mh = pv & xh
+        if ph & last:
+            score += 1
+        elif mh & last:
+            score -= 1
+        ph = (ph << 1) | 1
+        mh <<= 1
+        pv = (mh | ~(xv | ph)) & mask
+        mv = ph & xv & mask
+    return score
+
+if _vercomp is None:
+    version_compare = _py_version_compare
+    dpkg_sortkey = _py_dpkg_sortkey
+    edit_distance = _py_edit_distance
+else:
+    # the C implementation of the vercomp collation, which also orders
+    # invalid versions instead of falling back to plain string comparison
+    version_compare = _vercomp.version_compare
+    dpkg_sortkey = _vercomp.sortkey
+    edit_distance = _vercomp.edit_distance
 
 version_compare_key = functools.cmp_to_key(version_compare)
 
+def sort_versions(iterable, reverse=False):
+    ''' Sorts versions like the vercomp collation, computing each key once. '''
+    return sorted(iterable, key=dpkg_sortkey, reverse=reverse)
+
 def sizeof_fmt(num, suffix='B'):
     for unit in ('','Ki','Mi','Gi','Ti','Pi','Ei','Zi'):
         if abs(num) < 1024:
@@ -63,6 +160,21 @@ def parse_fail_arch(s):
     else:
         return TestList('@', [s])
 
+def iter_chunks(strings, size, encoding='utf-8'):
+    '''Joins an iterable of strings into encoded chunks of about `size`
+    bytes, for streamed responses.'''
+    chunk = []
+    length = 0
+    for s in strings:
+        chunk.append(s)
+        length += len(s)
+        if length >= size:
+            yield ''.join(chunk).encode(encoding)
+            chunk = []
+            length = 0
+    if chunk:
+        yield ''.join(chunk).encode(encoding)
+
 def iter_read1(fd):
     while True:
         res = fd.read1()
@@ -71,20 +183,147 @@ def iter_read1(fd):
         else:
             return
 
-def remember(ttl):
+def accept_encoding(header, available):
+    '''Picks the first of `available` content codings that an
+    Accept-Encoding header allows, or None for the identity coding.'''
+    accepted = {}
+    for item in (header or '').lower().split(','):
+        coding, _, params = item.partition(';')
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding.strip()] = q
+    for coding in available:
+        if accepted.get(coding, accepted.get('*', 0)) > 0:
+            return coding
+    return None
+
+def file_version(*filenames):
+    '''Returns a short fingerprint of the files, which changes whenever
+    one of them is modified or replaced.'''
+    h = hashlib.sha1()
+    for filename in filenames:
+        try:
+            st = os.stat(filename)
+        except OSError:
+            h.update(b'-;')
+            continue
+        h.update(('%d:%d:%d:%d;' % (st.st_dev, st.st_ino, st.st_size,
+                  st.st_mtime_ns)).encode('ascii'))
+    return h.hexdigest()[:16]
+
+def ttl_version(ttl):
+    '''A version function that changes every `ttl` seconds.'''
+    return lambda: int(time.time() // ttl)
+
+_tracking = threading.local()
+
+class _StaleFlag(object):
+    stale = False
+
+@contextlib.contextmanager
+def track_stale():
+    '''Notes whether `versioned` functions returned outdated results in
+    this thread within the block. Yields an object whose `stale` attribute
+    tells. An outdated result also marks the enclosing blocks.'''
+    flag = _StaleFlag()
+    outer = getattr(_tracking, 'flag', None)
+    _tracking.flag = flag
+    try:
+        yield flag
+    finally:
+        _tracking.flag = outer
+        if outer is not None and flag.stale:
+            outer.stale = True
+
+def _mark_stale():
+    flag = getattr(_tracking, 'flag', None)
+    if flag is not None:
+        flag.stale = True
+
+def versioned(version, maxsize=64, ignore=('db',)):
+    '''Caches the results of a function until `version()` changes.
+
+    Results are cached per argument. Arguments named in `ignore`, such as
+    database handles, are not part of the cache key. At most `maxsize`
+    results are kept, the least recently used ones are dropped first.
+
+    Only one thread computes a missing or outdated result at a time. While
+    it does, other callers get the outdated result if there is one, or
+    wait for the new one. With `wrapper.background` set, outdated results
+    are always served as is, and `wrapper.refresh()` is expected to be
+    called from elsewhere (see Refresher). Outdated results are reported to
+    `track_stale()`, and a result computed from outdated results of other
+    functions is not kept as current.
+    '''
     def deco(fn):
+        signature = inspect.signature(fn)
+
+        def getkey(args, kwargs):
+            bound = signature.bind(*args, **kwargs)
+            return tuple((k, v) for k, v in bound.arguments.items()
+                         if k not in ignore)
+
+        def compute(key, ver, args, kwargs, stale_ok):
+            with lock:
+                entry = cache.get(key)
+                if entry is not None:
+                    cache.move_to_end(key)
+                    if entry[0] == ver:
+                        return entry[1]
+                    elif stale_ok and (key in inflight or wrapper.background):
+                        _mark_stale()
+                        return entry[1]
+                event = inflight.get(key)
+                leader = event is None
+                if leader:
+                    event = inflight[key] = threading.Event()
+            if not leader:
+                event.wait()
+                with lock:
+                    entry = cache.get(key)
+                if entry is not None and entry[0] == ver:
+                    return entry[1]
+                # the other caller failed or the version changed meanwhile
+                return compute(key, ver, args, kwargs, stale_ok)
+            try:
+                with track_stale() as used:
+                    value = fn(*args, **kwargs)
+                with lock:
+                    cache[key] = (None if used.stale else ver, value)
+                    cache.move_to_end(key)
+                    while len(cache) > maxsize:
+                        cache.popitem(last=False)
+            finally:
+                with lock:
+                    del inflight[key]
+                event.set()
+            return value
+
         @functools.wraps(fn)
         def wrapper(*args, **kwargs):
-            now = time.monotonic()
-            if now - wrapper.last_updated > ttl:
-                wrapper.last_updated = now
-                wrapper.cached_value = fn(*args, **kwargs)
-            return wrapper.cached_value
-        wrapper.last_updated = float('-inf')
-        wrapper.cached_value = None
+            return compute(getkey(args, kwargs), version(), args, kwargs, True)
+
+        def refresh(*args, **kwargs):
+            '''Recomputes the result if it is outdated, then returns it.'''
+            return compute(getkey(args, kwargs), version(), args, kwargs, False)
+
+        cache = wrapper.cache = collections.OrderedDict()
+        inflight = {}
+        lock = threading.Lock()
+        wrapper.refresh = refresh
+        wrapper.background = False
         return wrapper
     return deco
 
+def remember(ttl):
+    return versioned(ttl_version(ttl))
+
 def groupby_val(iterable, key=None, resultkey=None, resultcmpkey=None):
     keys = []
     values = []
@@ -132,6 +371,84 @@ def toposort(data):
         raise CircularDependencyError(data)
 
 
+class SegmentIndex(object):
+    '''Finds the words within a small edit distance of a word, comparing
+    it only to a few candidates.
+
+    Each word is split into `maxdist` + 1 segments. A word within distance
+    n <= `maxdist` keeps at least `maxdist` + 1 - n of them unchanged, and
+    each of those appears in the searched word shifted by the edits made
+    before it. Only the words with enough such segments are compared.
+    '''
+
+    def __init__(self, words=(), maxdist=2, distance=None):
+        self.maxdist = maxdist
+        self.distance = distance or edit_distance
+        self.words = set()
+        # words too short to split, compared to every searched word
+        self.short = []
+        # (length, start, segment) -> words
+        self.segments = {}
+        for word in words:
+            self.add(word)
+
+    def bounds(self, length):
+        '''The (start, end) of the segments of a word of `length`.'''
+        count = self.maxdist + 1
+        size, longer = divmod(length, count)
+        start = 0
+        for i in range(count):
+            end = start + size + (i >= count - longer)
+            yield start, end
+            start = end
+
+    def add(self, word):
+        if word in self.words:
+            return
+        self.words.add(word)
+        if len(word) <= self.maxdist:
+            self.short.append(word)
+            return
+        for start, end in self.bounds(len(word)):
+            self.segments.setdefault(
+                (len(word), start, word[start:end]), []).append(word)
+
+    def search(self, word, maxdist, limit=None):
+        '''Returns the (distance, word) pairs within `maxdist` of `word`,
+        nearest first, then by word.'''
+        if maxdist > self.maxdist:
+            raise ValueError('maxdist is at most %d' % self.maxdist)
+        size = len(word)
+        candidates = [x for x in self.short if abs(len(x) - size) <= maxdist]
+        need = self.maxdist + 1 - maxdist
+        for length in range(max(size - maxdist, self.maxdist + 1),
+                            size + maxdist + 1):
+            delta = size - length
+            counts = collections.Counter()
+            for start, end in self.bounds(length):
+                matched = set()
+                for shift in range(-maxdist, maxdist + 1):
+                    # at least |shift| edits before the segment and
+                    # |delta - shift| after it
+                    pos = start + shift
+                    if (abs(shift) + abs(delta - shift) > maxdist or pos < 0
+                            or pos + end - start > size):
+                        continue
+                    words = self.segments.get(
+                        (length, start, word[pos:pos + end - start]))
+                    if words:
+                        matched.update(words)
+                counts.update(matched)
+            candidates.extend(x for x, n in counts.items() if n >= need)
+        found = []
+        distance = self.distance
+        for x in candidates:
+            dist = distance(word, x)
+            if dist <= maxdist:
+                found.append((dist, x))
+        found.sort()
+        return found[:limit]
+
 class FileRemover(object):
     def __init__(self):
         self.weak_references = dict()  # weak_ref -> filepath to remove
@@ -145,7 +462,250 @@ class FileRemover(object):
         # shutil.rmtree(filepath, ignore_errors=True)
         os.unlink(filepath)
 
+class LRUCache(object):
+    '''Thread-safe LRU mapping, bounded by the total size of its values.
+
+    `sizeof(value)` gives the size of a value in bytes.
+    '''
+
+    def __init__(self, maxbytes, sizeof=len):
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self.lock = threading.Lock()
+        self.data = collections.OrderedDict()
+        self.nbytes = 0
+        self.counters = collections.Counter()
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is None:
+                self.counters['misses'] += 1
+                return default
+            self.data.move_to_end(key)
+            self.counters['hits'] += 1
+            return entry[0]
+
+    def set(self, key, value):
+        size = self.sizeof(value)
+        if size > self.maxbytes:
+            return
+        with self.lock:
+            old = self.data.pop(key, None)
+            if old is not None:
+                self.nbytes -= old[1]
+            self.data[key] = (value, size)
+            self.nbytes += size
+            while self.nbytes > self.maxbytes:
+                _, (_, oldsize) = self.data.popitem(last=False)
+                self.nbytes -= oldsize
+                self.counters['evictions'] += 1
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        with self.lock:
+            d = dict(self.counters)
+            d.update(entries=len(self.data), bytes=self.nbytes,
+                     maxbytes=self.maxbytes)
+        return d
+
+class Refresher(object):
+    '''Runs jobs in a background thread every `interval` seconds.
+
+    Used to refresh `versioned` results before a request needs them. The
+    thread is started by `start()`, which is safe to call on every request;
+    it starts a new thread in a forked worker.
+    '''
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.jobs = []
+        self.lock = threading.Lock()
+        self.thread = None
+        self.pid = None
+
+    def add(self, job):
+        self.jobs.append(job)
+        return job
+
+    def start(self):
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.thread = threading.Thread(
+                target=self.run, name='refresher', daemon=True)
+            self.thread.start()
+            self.pid = os.getpid()
+
+    def run(self):
+        while True:
+            for job in self.jobs:
+                try:
+                    job()
+                except Exception:
+                    traceback.print_exc()
+            time.sleep(self.interval)
+
+class PoolTimeout(Exception):
+    pass
+
+class Pool(object):
+    '''Thread-safe connection pool for one worker process.
+
+    `connect()` opens a new connection. `check(conn, idle)` is called on
+    checkout with the seconds the connection has been idle, and returns
+    False if it is broken. `reset(conn)` is called on checkin. Connections
+    older than `max_lifetime` seconds are closed instead of reused.
+
+    Idle connections are handed out in LIFO order. At most `maxsize`
+    connections are open at once (None for no limit), and at most `maxidle`
+    are kept idle; extra ones are closed on checkin. If `version()` is
+    given, connections opened at another version are closed on checkout.
+    '''
+
+    def __init__(self, connect, maxsize=4, timeout=10, max_lifetime=3600,
+                 check=None, reset=None, maxidle=None, version=None):
+        self.connect = connect
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.check = check
+        self.reset = reset
+        self.maxidle = maxidle
+        self.version = version
+        self.cond = threading.Condition()
+        self.pid = os.getpid()
+        self.idle = []
+        self.born = {}
+        self.size = 0
+        self.counters = collections.Counter()
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        version = self.version() if self.version else None
+        stale = []
+        with self.cond:
+            if self.pid != os.getpid():
+                # forked: the connections belong to the parent process
+                self.pid = os.getpid()
+                self.idle = []
+                self.born = {}
+                self.size = 0
+            self.counters['checkouts'] += 1
+            waited = False
+            while True:
+                if self.idle:
+                    conn, released = self.idle.pop()
+                    if self.born[conn][1] != version:
+                        stale.append(conn)
+                        self.size -= 1
+                        continue
+                    break
+                elif self.maxsize is None or self.size < self.maxsize:
+                    self.size += 1
+                    conn = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.counters['timeouts'] += 1
+                    raise PoolTimeout('no connection available in %ss' %
+                                      self.timeout)
+                if not waited:
+                    self.counters['waits'] += 1
+                    waited = True
+                self.cond.wait(remaining)
+            born = self.born.get(conn, (None,))[0]
+        for oldconn in stale:
+            self._close(oldconn, 'stale')
+        now = time.monotonic()
+        if conn is not None:
+            if (self.max_lifetime is not None and
+                    now - born > self.max_lifetime):
+                self._close(conn, 'recycled')
+                conn = None
+            elif self.check and not self._check(conn, now - released):
+                self._close(conn, 'discarded')
+                conn = None
+        if conn is None:
+            try:
+                conn = self.connect()
+            except Exception:
+                with self.cond:
+                    self.size -= 1
+                    self.cond.notify()
+                raise
+            with self.cond:
+                self.counters['connects'] += 1
+                self.born[conn] = (now, version)
+        return conn
+
+    def release(self, conn, discard=False):
+        if not discard and self.reset:
+            try:
+                self.reset(conn)
+            except Exception:
+                discard = True
+        with self.cond:
+            if self.pid != os.getpid() or conn not in self.born:
+                return
+            if not discard and (self.maxidle is None or
+                                len(self.idle) < self.maxidle):
+                self.idle.append((conn, time.monotonic()))
+            else:
+                discard = True
+                self.size -= 1
+            self.cond.notify()
+        if discard:
+            self._close(conn, 'discarded')
+
+    def clear(self):
+        '''Closes the idle connections.'''
+        with self.cond:
+            idle, self.idle = self.idle, []
+            self.size -= len(idle)
+            self.cond.notify_all()
+        for conn, released in idle:
+            self._close(conn, 'discarded')
+
+    def _check(self, conn, idle):
+        try:
+            return self.check(conn, idle)
+        except Exception:
+            return False
+
+    def _close(self, conn, reason):
+        with self.cond:
+            self.counters[reason] += 1
+            self.born.pop(conn, None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    @contextlib.contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def stats(self):
+        with self.cond:
+            d = dict(self.counters)
+            d.update(size=self.size, idle=len(self.idle),
+                     in_use=self.size - len(self.idle), maxsize=self.maxsize)
+        return d
+
 class Pager(collections.abc.Iterable):
+    key = after = next = None
+
     def __init__(self, iterable, pagesize, page=1):
         '''Page number starts from 1.'''
         self.iterator = iter(iterable)
@@ -180,3 +740,43 @@ class Pager(collections.abc.Iterable):
             pass
         self._pagecount = math.ceil((self.index+1)/self.pagesize)
         return self._pagecount
+
+class QueryPager(Pager):
+    '''Like Pager, but lets the database skip to the page.
+
+    `query(limit, offset)` returns the rows of a page, and `count()` returns
+    the total number of rows. If `key` is given, `next` is set to the key of
+    the last row after iterating, if there are more rows.
+    '''
+    def __init__(self, query, count, pagesize, page=1, key=None, after=None):
+        self.query = query
+        self._count = count
+        self.pagesize = pagesize
+        self.page = page
+        self.key = key
+        self.after = after
+        self.next = None
+        self._total = None
+
+    def __iter__(self):
+        if self.page < 1:
+            return
+        offset = (self.page-1) * self.pagesize
+        if self.key is None:
+            yield from self.query(self.pagesize, offset)
+            return
+        # fetch one more row to know whether there is a next page
+        rows = iter(self.query(self.pagesize + 1, offset))
+        row = None
+        for row in itertools.islice(rows, self.pagesize):
+            yield row
+        if row is not None and next(rows, None) is not None:
+            self.next = self.key(row)
+
+    def count(self):
+        if self._total is None:
+            self._total = self._count()
+        return self._total
+
+    def pagecount(self):
+        return math.ceil(self.count()/self.pagesize)
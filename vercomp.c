@@ -1,126 +1,20 @@
-#include <ctype.h>
 #include <stdlib.h>
 #include <string.h>
 #include <stdio.h>
 #include "sqlite3ext.h"
 SQLITE_EXTENSION_INIT1
+#include "vercomp.h"
 
 #define UNUSED(x) (void)(x)
 
-/*
- * Implementation of the "vercomp" collation.
+/* SQLite collation: vercomp
  * This collation sorts TEXT using Debian version comparison rules.
  */
-
-typedef struct dpkg_version {
-    long epoch;
-    const char* version;
-    const char* revision;
-} dpkg_version_t;
-
-static dpkg_version_t parse_version(char *string) {
-    dpkg_version_t version = {0, "", "0"};
-    char *colon, *hyphen;
-    colon = strchr(string, ':');
-    if (colon) {
-        version.epoch = strtol(string, NULL, 10);
-        string = colon+1;
-    }
-    version.version = string;
-    hyphen = strrchr(string, '-');
-    if (hyphen) {
-        *hyphen++ = 0;
-        version.revision = hyphen;
-    }
-    return version;
-}
-
-static int order(int c) {
-	if (isdigit(c)) {
-		return 0;
-	} else if (isalpha(c)) {
-		return c;
-	} else if (c == '~') {
-		return -1;
-	} else if (c) {
-		return c + 256;
-	} else {
-		return 0;
-    }
-}
-
-static int version_compare(const char *a, const char *b) {
-    while (*a || *b) {
-        int first_diff = 0;
-
-        while ((*a && !isdigit(*a)) || (*b && !isdigit(*b))) {
-            int ac = order(*a);
-            int bc = order(*b);
-
-            if (ac != bc)
-                return ac - bc;
-
-            a++;
-            b++;
-        }
-        while (*a == '0')
-            a++;
-        while (*b == '0')
-            b++;
-        while (isdigit(*a) && isdigit(*b)) {
-            if (!first_diff)
-                first_diff = *a - *b;
-            a++;
-            b++;
-        }
-
-        if (isdigit(*a))
-            return 1;
-        if (isdigit(*b))
-            return -1;
-        if (first_diff)
-            return first_diff;
-    }
-    return 0;
-}
-
-static int dpkg_version_compare(char *svera, char *sverb){
-    dpkg_version_t vera, verb;
-    int comp;
-    vera = parse_version(svera);
-    verb = parse_version(sverb);
-
-    if (vera.epoch < verb.epoch) {
-        return -1;
-    } else if (vera.epoch > verb.epoch) {
-        return 1;
-    }
-    comp = version_compare(vera.version, verb.version);
-    if (comp) return comp;
-    return version_compare(vera.revision, verb.revision);
-}
-
-/* SQLite collation: vercomp */
 int vercomp_collation(
     void *pArg, int nSa, const void *bSa, int nSb, const void *bSb
 ){
-    char *svera, *sverb;
-    int comp;
     UNUSED(pArg);
-    svera = (char *)malloc(nSa + 1);
-    sverb = (char *)malloc(nSb + 1);
-    svera[nSa] = sverb[nSb] = 0;
-    memcpy(svera, bSa, nSa);
-    memcpy(sverb, bSb, nSb);
-    comp = dpkg_version_compare(svera, sverb);
-    if (comp == 0) {
-        memcpy(svera, bSa, nSa);
-        memcpy(sverb, bSb, nSb);
-        comp = strcmp(svera, sverb);
-    }
-    free(svera);
-    free(sverb);
-    return comp;
+    return vercomp_compare(bSa, nSa, bSb, nSb);
 }
 
 /* SQLite function:
@@ -146,24 +40,13 @@ void compare_dpkgrel(
         return;
     }
 
-    int nver1, nver2;
-    char *sver1, *sver2;
     int cmp_result, result;
+    const void *pver1 = sqlite3_value_text(argv[0]);
+    int nver1 = sqlite3_value_bytes(argv[0]);
+    const void *pver2 = sqlite3_value_text(argv[2]);
+    int nver2 = sqlite3_value_bytes(argv[2]);
 
-    const char *pver1 = (const char *)sqlite3_value_text(argv[0]);
-    nver1 = strlen(pver1);
-    sver1 = (char *)malloc(nver1);
-    memcpy(sver1, pver1, nver1);
-
-    const char *pver2 = (const char *)sqlite3_value_text(argv[2]);
-    nver2 = strlen(pver2);
-    sver2 = (char *)malloc(nver2);
-    memcpy(sver2, pver2, nver2);
-
-    cmp_result = vercomp_collation(NULL, nver1, sver1, nver2, sver2);
-
-    free(sver1);
-    free(sver2);
+    cmp_result = vercomp_collation(NULL, nver1, pver1, nver2, pver2);
 
     const char *p_op = (const char *)sqlite3_value_text(argv[1]);
 
@@ -259,6 +142,104 @@ void make_dpkg_version(
     return;
 }
 
+/* SQLite function: dpkg_sortkey(version) -> blob
+ * See vercomp.h for the format.
+ */
+void dpkg_sortkey(
+    sqlite3_context *ctx, int argc, sqlite3_value **argv
+){
+    const unsigned char *pver;
+    unsigned char *key;
+    int nver;
+    UNUSED(argc);
+    if (sqlite3_value_type(argv[0]) == SQLITE_NULL) {
+        sqlite3_result_null(ctx);
+        return;
+    }
+    pver = sqlite3_value_text(argv[0]);
+    nver = sqlite3_value_bytes(argv[0]);
+    key = sqlite3_malloc64(DPKG_SORTKEY_SIZE(nver));
+    if (!key) {
+        sqlite3_result_error_nomem(ctx);
+        return;
+    }
+    sqlite3_result_blob(
+        ctx, key, dpkg_sortkey_write(key, pver, nver), sqlite3_free);
+}
+
+/* SQLite aggregates:
+ * max_vercomp(version), min_vercomp(version) -> text
+ * argmax_vercomp(version, value), argmin_vercomp(version, value) -> value
+ *
+ * Equivalent to max(version COLLATE vercomp) and friends, but keep only
+ * the current best value, so that GROUP BY does not need to sort. The
+ * arg* variants return `value` from the row holding the extreme version;
+ * the first such row wins on ties. NULL versions are ignored.
+ */
+typedef struct vercomp_agg {
+    char *version;
+    int nversion;
+    int capacity;
+    int found;
+    sqlite3_value *value;
+} vercomp_agg_t;
+
+static void vercomp_agg_step(
+    sqlite3_context *ctx, int argc, sqlite3_value **argv
+){
+    vercomp_agg_t *agg;
+    const void *pver;
+    int nver;
+    int sign = *(int *)sqlite3_user_data(ctx);
+    if (sqlite3_value_type(argv[0]) == SQLITE_NULL)
+        return;
+    agg = (vercomp_agg_t *)sqlite3_aggregate_context(ctx, sizeof(*agg));
+    if (!agg)
+        return;
+    pver = sqlite3_value_text(argv[0]);
+    nver = sqlite3_value_bytes(argv[0]);
+    if (agg->found && sign * vercomp_collation(
+            NULL, nver, pver, agg->nversion, agg->version) <= 0)
+        return;
+    /* the buffer only ever grows, so a group costs a few allocations */
+    if (nver > agg->capacity) {
+        char *buf = sqlite3_realloc(agg->version, nver);
+        if (!buf) {
+            sqlite3_result_error_nomem(ctx);
+            return;
+        }
+        agg->version = buf;
+        agg->capacity = nver;
+    }
+    memcpy(agg->version, pver, nver);
+    agg->nversion = nver;
+    agg->found = 1;
+    if (argc > 1) {
+        sqlite3_value_free(agg->value);
+        agg->value = sqlite3_value_dup(argv[1]);
+        if (!agg->value)
+            sqlite3_result_error_nomem(ctx);
+    }
+}
+
+static void vercomp_agg_final(sqlite3_context *ctx){
+    vercomp_agg_t *agg;
+    agg = (vercomp_agg_t *)sqlite3_aggregate_context(ctx, 0);
+    if (!agg)
+        return;
+    if (agg->value) {
+        sqlite3_result_value(ctx, agg->value);
+    } else if (agg->found) {
+        sqlite3_result_text(
+            ctx, agg->version, agg->nversion, SQLITE_TRANSIENT);
+    }
+    sqlite3_free(agg->version);
+    sqlite3_value_free(agg->value);
+}
+
+static int agg_max = 1;
+static int agg_min = -1;
+
 static int modvercomp_install(sqlite3 *db){
     int rc = SQLITE_OK;
     rc = sqlite3_create_collation(
@@ -271,6 +252,26 @@ static int modvercomp_install(sqlite3 *db){
     rc = sqlite3_create_function(
         db, "dpkg_version", 3, SQLITE_UTF8 | SQLITE_DETERMINISTIC,
         NULL, make_dpkg_version, NULL, NULL);
+    if (rc) return rc;
+    rc = sqlite3_create_function(
+        db, "dpkg_sortkey", 1, SQLITE_UTF8 | SQLITE_DETERMINISTIC,
+        NULL, dpkg_sortkey, NULL, NULL);
+    if (rc) return rc;
+    rc = sqlite3_create_function(
+        db, "max_vercomp", 1, SQLITE_UTF8 | SQLITE_DETERMINISTIC,
+        &agg_max, NULL, vercomp_agg_step, vercomp_agg_final);
+    if (rc) return rc;
+    rc = sqlite3_create_function(
+        db, "min_vercomp", 1, SQLITE_UTF8 | SQLITE_DETERMINISTIC,
+        &agg_min, NULL, vercomp_agg_step, vercomp_agg_final);
+    if (rc) return rc;
+    rc = sqlite3_create_function(
+        db, "argmax_vercomp", 2, SQLITE_UTF8 | SQLITE_DETERMINISTIC,
+        &agg_max, NULL, vercomp_agg_step, vercomp_agg_final);
+    if (rc) return rc;
+    rc = sqlite3_create_function(
+        db, "argmin_vercomp", 2, SQLITE_UTF8 | SQLITE_DETERMINISTIC,
+        &agg_min, NULL, vercomp_agg_step, vercomp_agg_final);
     return rc;
 }
 
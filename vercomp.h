@@ -0,0 +1,239 @@
+#ifndef VERCOMP_H
+#define VERCOMP_H
+
+#include <stdlib.h>
+#include <string.h>
+
+/*
+ * Debian version comparison, shared by the SQLite extension (vercomp.c)
+ * and the Python module (_vercomp.c).
+ */
+
+typedef struct dpkg_version {
+    long epoch;
+    const unsigned char *version;
+    const unsigned char *version_end;
+    const unsigned char *revision;
+    const unsigned char *revision_end;
+} dpkg_version_t;
+
+/* Versions are compared in place on the buffers they come in, which are
+ * not NUL-terminated.  Every component is a [start, end) range, and a read
+ * past the end of a range yields 0, standing in for the terminator the
+ * string-based comparison used to rely on.
+ *
+ * Characters are read as unsigned and classified as ASCII, independent of
+ * the C locale.  Bytes >= 0x80 therefore sort after all punctuation, as in
+ * python-debian, rather than depending on the signedness of char.
+ */
+#define AT(p, end) ((p) < (end) ? *(p) : 0)
+#define IS_DIGIT(c) ((c) >= '0' && (c) <= '9')
+#define IS_ALPHA(c) (((c) >= 'A' && (c) <= 'Z') || ((c) >= 'a' && (c) <= 'z'))
+
+static const unsigned char zero_revision[] = "0";
+
+static dpkg_version_t parse_version(const unsigned char *string, int len) {
+    const unsigned char *end = string + len;
+    const unsigned char *colon, *hyphen;
+    dpkg_version_t version = {
+        0, string, end, zero_revision, zero_revision + 1
+    };
+    colon = memchr(string, ':', len);
+    if (colon) {
+        /* strtol stops at the colon at the latest */
+        version.epoch = strtol((const char *)string, NULL, 10);
+        version.version = colon + 1;
+    }
+    for (hyphen = end; hyphen > version.version; hyphen--) {
+        if (hyphen[-1] == '-') {
+            version.version_end = hyphen - 1;
+            version.revision = hyphen;
+            version.revision_end = end;
+            break;
+        }
+    }
+    return version;
+}
+
+static int order(int c) {
+    if (IS_DIGIT(c)) {
+        return 0;
+    } else if (IS_ALPHA(c)) {
+        return c;
+    } else if (c == '~') {
+        return -1;
+    } else if (c) {
+        return c + 256;
+    } else {
+        return 0;
+    }
+}
+
+static int version_compare(
+    const unsigned char *a, const unsigned char *aend,
+    const unsigned char *b, const unsigned char *bend
+){
+    while (a < aend || b < bend) {
+        int first_diff = 0;
+
+        while ((a < aend && !IS_DIGIT(*a)) || (b < bend && !IS_DIGIT(*b))) {
+            int ac = order(AT(a, aend));
+            int bc = order(AT(b, bend));
+
+            if (ac != bc)
+                return ac - bc;
+
+            a++;
+            b++;
+        }
+        while (a < aend && *a == '0')
+            a++;
+        while (b < bend && *b == '0')
+            b++;
+        while (a < aend && b < bend && IS_DIGIT(*a) && IS_DIGIT(*b)) {
+            if (!first_diff)
+                first_diff = *a - *b;
+            a++;
+            b++;
+        }
+
+        if (a < aend && IS_DIGIT(*a))
+            return 1;
+        if (b < bend && IS_DIGIT(*b))
+            return -1;
+        if (first_diff)
+            return first_diff;
+    }
+    return 0;
+}
+
+static int dpkg_version_compare(
+    const unsigned char *svera, int nvera,
+    const unsigned char *sverb, int nverb
+){
+    dpkg_version_t vera, verb;
+    int comp;
+    vera = parse_version(svera, nvera);
+    verb = parse_version(sverb, nverb);
+
+    if (vera.epoch < verb.epoch) {
+        return -1;
+    } else if (vera.epoch > verb.epoch) {
+        return 1;
+    }
+    comp = version_compare(
+        vera.version, vera.version_end, verb.version, verb.version_end);
+    if (comp) return comp;
+    return version_compare(
+        vera.revision, vera.revision_end, verb.revision, verb.revision_end);
+}
+
+/* Debian version comparison for use as a collation.
+ * Versions that dpkg considers equal are ordered bytewise, so that
+ * the order stays total.
+ */
+static int vercomp_compare(
+    const void *svera, int nvera, const void *sverb, int nverb
+){
+    int comp;
+    comp = dpkg_version_compare(svera, nvera, sverb, nverb);
+    if (comp == 0) {
+        comp = memcmp(svera, sverb, nvera < nverb ? nvera : nverb);
+        if (comp == 0)
+            comp = nvera - nverb;
+    }
+    return comp;
+}
+
+/* Sort keys
+ *
+ * Encodes a version into bytes whose memcmp order is the order of
+ * vercomp_compare(), so that version columns can be indexed and compared
+ * without a collation:
+ *
+ *   epoch     8 bytes, big endian, sign bit flipped
+ *   upstream  encoded part
+ *   revision  encoded part ("0" if missing)
+ *   version   the original string, to break ties like the collation does
+ *
+ * A part is a sequence of (non-digit run, number) pairs followed by
+ * KEY_PART_END. Run characters map to bytes in the order of order():
+ * '~' to KEY_TILDE, letters to themselves, anything else to KEY_OTHER
+ * followed by the character; the run ends with KEY_RUN_END, which sorts
+ * like the end of a run does. Numbers are their digits with leading zeros
+ * stripped, prefixed by the digit count (0xFF and 4 more bytes if that
+ * doesn't fit). KEY_PART_END only ever meets the first byte of a
+ * non-empty run, so a finished part sorts between '~' and letters, as an
+ * exhausted string does in version_compare().
+ *
+ * The pure-Python utils.dpkg_sortkey() produces the same keys.
+ */
+#define KEY_TILDE 0x01
+#define KEY_RUN_END 0x02
+#define KEY_PART_END 0x03
+#define KEY_OTHER 0xFE
+
+static unsigned char *sortkey_part(
+    unsigned char *out, const unsigned char *s, const unsigned char *end
+){
+    const unsigned char *digits;
+    size_t ndigits;
+    do {
+        while (s < end && !IS_DIGIT(*s)) {
+            if (*s == '~') {
+                *out++ = KEY_TILDE;
+            } else if (IS_ALPHA(*s)) {
+                *out++ = *s;
+            } else {
+                *out++ = KEY_OTHER;
+                *out++ = *s;
+            }
+            s++;
+        }
+        *out++ = KEY_RUN_END;
+        while (s < end && *s == '0')
+            s++;
+        digits = s;
+        while (s < end && IS_DIGIT(*s))
+            s++;
+        ndigits = s - digits;
+        if (ndigits < 0xFF) {
+            *out++ = ndigits;
+        } else {
+            *out++ = 0xFF;
+            *out++ = ndigits >> 24;
+            *out++ = ndigits >> 16;
+            *out++ = ndigits >> 8;
+            *out++ = ndigits;
+        }
+        memcpy(out, digits, ndigits);
+        out += ndigits;
+    } while (s < end);
+    *out++ = KEY_PART_END;
+    return out;
+}
+
+/* Upper bound of the key size: a character takes at most 2 bytes, plus
+ * one per run end and number length, plus the original string. */
+#define DPKG_SORTKEY_SIZE(len) (4 * (size_t)(len) + 32)
+
+/* Writes the key of version into out, returns its length. */
+static size_t dpkg_sortkey_write(
+    unsigned char *out, const unsigned char *version, int len
+){
+    unsigned char *start = out;
+    unsigned long long epoch;
+    dpkg_version_t ver;
+    int i;
+    ver = parse_version(version, len);
+    epoch = (unsigned long long)ver.epoch ^ (1ULL << 63);
+    for (i = 56; i >= 0; i -= 8)
+        *out++ = epoch >> i;
+    out = sortkey_part(out, ver.version, ver.version_end);
+    out = sortkey_part(out, ver.revision, ver.revision_end);
+    memcpy(out, version, len);
+    out += len;
+    return out - start;
+}
+
+#endif